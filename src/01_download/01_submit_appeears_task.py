@@ -16,7 +16,11 @@ import os
 
 import requests
 
-from src.utils.constants import EARTHDATA_PASSWORD, EARTHDATA_USERNAME
+from src.utils.constants import (
+    APPEEARS_API_URL,
+    EARTHDATA_PASSWORD,
+    EARTHDATA_USERNAME
+)
 
 
 def submit_task(task: dict, username: str, password: str) -> str:
@@ -39,7 +43,7 @@ def submit_task(task: dict, username: str, password: str) -> str:
     properties that can be specified, check the documentation:
     https://lpdaacsvc.cr.usgs.gov/appeears/api/#task-object
     """
-    api_url = "https://lpdaacsvc.cr.usgs.gov/appeears/api"
+    api_url = APPEEARS_API_URL
 
     try:
         # get authorization token and build headers
@@ -5,12 +5,11 @@
 # -----------------------------------------------------------------------
 import os
 
-import geopandas
 import rioxarray
 import xarray as xr
-from shapely.geometry import mapping
 
-from src.utils.constants import REGIONS
+from src.utils.constants import REGIONS, TIME_CHUNK_SIZE
+from src.utils.functions import clip_regions, write_cubes
 
 
 if __name__ == "__main__":
@@ -24,21 +23,27 @@ if __name__ == "__main__":
 
     # Although the original NetCDF4 data has already spatial dimensions
     # and a coordinate reference system, explicitly setting them is
-    # required for rioxarray's clip method to work.
+    # required for clip_regions to work.
     ds = ds.rio.set_spatial_dims(x_dim="lon", y_dim="lat")
     ds = ds.rio.write_crs("epsg:4326")
 
     # Clip the original NetCDF4 data for each specified window and save
-    # to a new NetCDF4 file.
+    # to a new NetCDF4 file. All the windows are clipped from a single
+    # read of the original data.
+    save_paths = []
     for region in REGIONS:
 
         output_folder = f"data/nc/MODIS/MCD64A1/{region['name']}"
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
 
-        mask = geopandas.read_file(region["path"])
-        geometry = mask.geometry.apply(mapping)
-        window_ds = ds.rio.clip(geometry)
+        save_paths.append(os.path.join(output_folder, "MCD64A1_500m.nc"))
 
-        save_to = os.path.join(output_folder, "MCD64A1_500m.nc")
-        window_ds.to_netcdf(save_to)
+    window_datasets = clip_regions(ds, REGIONS, "lon", "lat", TIME_CHUNK_SIZE)
+    write_cubes(
+        window_datasets,
+        save_paths,
+        x_dim="lon",
+        y_dim="lat",
+        time_chunk=TIME_CHUNK_SIZE,
+    )
@@ -1,17 +1,95 @@
 # -----------------------------------------------------------------------
 # Author: Marcelo Villa-Piñeros
 #
-# Purpose:
+# Purpose: Reclassifies the national landcover rasters and resamples them
+# to the grid of each region's MCD64A1 data cube.
+#
+# Notes: Each landcover raster is reclassified once to a temporary file
+# that is shared by the warps of all the regions. The warps for every
+# (year, region) pair are independent and run in a process pool, each
+# of them using several threads.
 # -----------------------------------------------------------------------
 import glob
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import rioxarray
 import xarray as xr
 from osgeo import gdal
 
 from src.utils.constants import REGIONS, RECLASSIFY_MAP
-from src.utils.functions import reclassify
+from src.utils.functions import reclassify_raster
+
+# Number of threads used by each warp and number of parallel processes
+# so that all the available cores are used.
+WARP_THREADS = 2
+MAX_WORKERS = max(1, os.cpu_count() // WARP_THREADS)
+
+
+def reclassify(src_fn: str, dst_fn: str) -> str:
+    """
+    Reclassifies a landcover raster to a tiled and compressed GeoTIFF.
+
+    Parameters
+    ----------
+    src_fn: path to the original landcover raster.
+    dst_fn: path to the reclassified raster.
+
+    Returns
+    -------
+    Path to the reclassified raster.
+    """
+    # The original raster is reclassified block by block using a lookup
+    # table so it never has to be entirely loaded into memory.
+    src_ds = gdal.Open(src_fn)
+    out_ds = reclassify_raster(
+        src_ds,
+        dst_fn,
+        RECLASSIFY_MAP,
+        gdal.GDT_Byte,
+        nd_val=255,
+        options=["TILED=YES", "COMPRESS=LZW"]
+    )
+    out_ds = None
+
+    return dst_fn
+
+
+def warp(src_fn: str, dst_fn: str, grid: dict, cutline: str) -> str:
+    """
+    Resamples a reclassified landcover raster to a region's grid using
+    the mode of the source pixels.
+
+    Parameters
+    ----------
+    src_fn:  path to the reclassified landcover raster.
+    dst_fn:  output raster's file name.
+    grid:    dictionary with the bounds and the resolution of the target
+             grid.
+    cutline: path to the region's shapefile.
+
+    Returns
+    -------
+    Path to the output raster.
+    """
+    warp_options = gdal.WarpOptions(
+        format="GTiff",
+        outputBounds=grid["bounds"],
+        xRes=grid["xres"],
+        yRes=grid["yres"],
+        creationOptions=["COMPRESS=LZW"],
+        resampleAlg="mode",
+        dstNodata=255,
+        outputType=gdal.GDT_Byte,
+        cutlineDSName=cutline,
+        multithread=True,
+        warpOptions=[f"NUM_THREADS={WARP_THREADS}"]
+    )
+    out_ds = gdal.Warp(dst_fn, src_fn, options=warp_options)
+    out_ds = None
+
+    return dst_fn
+
 
 if __name__ == "__main__":
 
@@ -20,46 +98,50 @@ if __name__ == "__main__":
 
     landcover_filenames = sorted(glob.glob("data/tif/landcover/original/*.tif"))
 
-    for landcover_fn in landcover_filenames:
-
-        ds = gdal.Open(landcover_fn)
-        band = ds.GetRasterBand(1)
-        arr = ds.ReadAsArray()
-        reclassed_arr = reclassify(arr, RECLASSIFY_MAP)
-
-        # Create temp raster with the reclassified values
-        driver = gdal.GetDriverByName("MEM")
-        temp = driver.Create("temp", ds.RasterXSize, ds.RasterYSize, 1, gdal.GDT_Byte)
-        temp.SetProjection(ds.GetProjection())
-        temp.SetGeoTransform(ds.GetGeoTransform())
-        temp_band = temp.GetRasterBand(1)
-        temp_band.SetNoDataValue(255)
-        temp_band.WriteArray(reclassed_arr)
-        temp_band.FlushCache()
-
-        for region in REGIONS:
-
-            output_folder = f"data/tif/landcover/{region['name']}"
-            if not os.path.exists(output_folder):
-                os.makedirs(output_folder)
-
-            # Open clipped burned area product to later obtain extent
-            # and resolution from.
-            burned_area_fn = f"data/nc/MODIS/MCD64A1/{region['name']}/MCD64A1_500m.nc"
-            ds = xr.open_dataset(burned_area_fn)
-
-            warp_options = gdal.WarpOptions(
-                format="GTiff",
-                outputBounds=ds.rio.bounds(),
-                xRes=ds.rio.resolution()[0],
-                yRes=abs(ds.rio.resolution()[1]),
-                creationOptions=["COMPRESS=LZW"],
-                resampleAlg="mode",
-                dstNodata=255,
-                outputType=gdal.GDT_Byte,
-                cutlineDSName=region["path"]
-            )
-
-            basename = os.path.basename(landcover_fn)
-            output_fn = os.path.join(output_folder, basename)
-            gdal.Warp(output_fn, temp, options=warp_options)
\ No newline at end of file
+    temp_folder = "data/tif/landcover/temp"
+    if not os.path.exists(temp_folder):
+        os.makedirs(temp_folder)
+
+    # Obtain the extent and resolution of each region's clipped burned
+    # area product only once.
+    grids = {}
+    for region in REGIONS:
+
+        output_folder = f"data/tif/landcover/{region['name']}"
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+
+        burned_area_fn = f"data/nc/MODIS/MCD64A1/{region['name']}/MCD64A1_500m.nc"
+        with xr.open_dataset(burned_area_fn) as ds:
+            grids[region["name"]] = {
+                "bounds": ds.rio.bounds(),
+                "xres": ds.rio.resolution()[0],
+                "yres": abs(ds.rio.resolution()[1]),
+            }
+
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
+
+        temp_filenames = [
+            os.path.join(temp_folder, os.path.basename(fn))
+            for fn in landcover_filenames
+        ]
+        list(executor.map(reclassify, landcover_filenames, temp_filenames))
+
+        futures = []
+        for temp_fn in temp_filenames:
+            for region in REGIONS:
+                output_folder = f"data/tif/landcover/{region['name']}"
+                output_fn = os.path.join(output_folder, os.path.basename(temp_fn))
+                futures.append(
+                    executor.submit(
+                        warp, temp_fn, output_fn, grids[region["name"]], region["path"]
+                    )
+                )
+
+        # Retrieve the results to raise any exception from the workers.
+        for future in futures:
+            future.result()
+
+    for temp_fn in temp_filenames:
+        os.remove(temp_fn)
+    os.rmdir(temp_folder)
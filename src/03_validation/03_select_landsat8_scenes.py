@@ -1,12 +1,21 @@
 # -----------------------------------------------------------------------
 # Author: Marcelo Villa-Piñeros
 #
-# Purpose:
+# Purpose: Selects the Landsat 8 tier 1 scenes of the area of interest
+# acquired in the validation period with a cloud cover below the
+# threshold.
+#
+# Notes: Scenes are selected from a local index of the S3 Landsat 8
+# scene list. The index is rebuilt (streaming the scene list from the
+# URL) the first time, when it does not cover the path/rows of the area
+# of interest and when the scene list has been updated since the index
+# was built (i.e. its ETag or Last-Modified header changed). If the
+# headers of the scene list cannot be requested, the local index is
+# used as long as it covers the path/rows.
 # -----------------------------------------------------------------------
 import os
 
 import geopandas
-import pandas as pd
 
 from src.utils.constants import (
     S3_LANDSAT8_SCENE_LIST_URL,
@@ -14,6 +23,7 @@ from src.utils.constants import (
     L8_END_DATE,
     L8_CLOUD_THRESHOLD
 )
+from src.utils.landsat import get_scene_index, select_scenes
 
 if __name__ == "__main__":
 
@@ -26,29 +36,19 @@ if __name__ == "__main__":
 
     filepath = "data/shp/landsat/WRS2_descending_orinoquia.shp"
     wrs2_grid_aoi = geopandas.read_file(filepath)
-
-    # Get a DataFrame with the S3 Landsat 8 scene list from an URL.
-    l8_scenes = pd.read_csv(S3_LANDSAT8_SCENE_LIST_URL, compression="gzip")
-
-    # Create a new column with the path/row concatenation.
-    path_str = l8_scenes["path"].astype(str).str.zfill(3)
-    row_str = l8_scenes["row"].astype(str).str.zfill(3)
-    l8_scenes["pr"] = path_str + row_str
-
-    # Filter scenes by date.
-    l8_scenes["acquisitionDate"] = pd.to_datetime(l8_scenes["acquisitionDate"])
-
-    # Filter scenes by date, area of interest and cloud cover. Remove
-    # real-time (RT) and tier 2 (T2) scenes which have to go through
-    # further preprocessing and calibration.
-    l8_scenes_subset = l8_scenes.loc[
-        (l8_scenes["acquisitionDate"] >= L8_START_DATE)
-        & (l8_scenes["acquisitionDate"] <= L8_END_DATE)
-        & (l8_scenes["pr"].isin(wrs2_grid_aoi["PR"]))
-        & (l8_scenes["cloudCover"] <= L8_CLOUD_THRESHOLD)
-        & (~l8_scenes["productId"].str.endswith("RT"))
-        & (~l8_scenes["productId"].str.endswith("T2"))
-    ]
+    prs = wrs2_grid_aoi["PR"].astype(int)
+
+    # Get the local index of the S3 Landsat 8 scene list, rebuilding it
+    # if needed (see the notes above).
+    l8_scenes = get_scene_index(
+        S3_LANDSAT8_SCENE_LIST_URL, "data/csv/landsat/scene_index.pkl", prs
+    )
+
+    # Filter scenes by date, area of interest and cloud cover. Real-time
+    # (RT) and tier 2 (T2) scenes are already excluded from the index.
+    l8_scenes_subset = select_scenes(
+        l8_scenes, L8_START_DATE, L8_END_DATE, L8_CLOUD_THRESHOLD, prs
+    )
 
     save_to = os.path.join(output_folder, "reference_landsat8_scenes.csv")
     l8_scenes_subset.to_csv(save_to, index=False)
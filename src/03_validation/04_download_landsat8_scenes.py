@@ -1,16 +1,21 @@
 # -----------------------------------------------------------------------
 # Author: Marcelo Villa-Piñeros
 #
-# Purpose:
+# Purpose: Downloads the bands of the selected Landsat 8 scenes.
+#
+# Notes: The index pages of the scenes are resolved concurrently and
+# their links are cached, so running the script again only downloads
+# the bands that are missing or incomplete.
 # -----------------------------------------------------------------------
 import os
 
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
 
 from src.utils.constants import L8_BANDS
-from src.utils.functions import download_http_file
+from src.utils.landsat import download_scenes
+
+# Maximum number of files downloaded at the same time across all scenes.
+MAX_FILES = 8
 
 if __name__ == "__main__":
 
@@ -20,33 +25,13 @@ if __name__ == "__main__":
     filepath = "results/csv/validation/reference_landsat8_scenes.csv"
     l8_scenes_subset = pd.read_csv(filepath)
 
+    scenes = []
     for i, row in l8_scenes_subset.iterrows():
-
         pr = str(row["pr"]).zfill(6)
-        output_folder = f"data/tif/landsat/{pr}"
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-
-        index_url = row["download_url"]
-        r = requests.get(index_url)
-        soup = BeautifulSoup(r.content, features="html.parser")
-
-        # Isolate base url to join later with filename.
-        base_url = os.path.dirname(index_url)
-
-        # Select all anchor tags with an href attribute.
-        tags = soup.find_all("a", href=True)
-
-        # Keep only anchor tags whose href attribute is a TIF file
-        # and whose band is the list of wanted bands. Bands are matched
-        # with a dot (.) at the end to avoid confusions, between bands
-        # B1 and  B10 and B11.
-        tags = filter(lambda x: x["href"].endswith(".TIF"), tags)
-        tags = filter(
-            lambda x: any([f"{band}." in x["href"] for band in L8_BANDS]), tags
-        )
-
-        for tag in tags:
-            print(tag)
-            url = os.path.join(base_url, tag.get("href"))
-            download_http_file(url, output_folder)
+        scenes.append((row["download_url"], f"data/tif/landsat/{pr}"))
+
+    for index_url, error in download_scenes(
+        scenes, L8_BANDS, MAX_FILES, cache_fn="data/csv/landsat/band_urls.json"
+    ):
+        if error is not None:
+            print(f"Could not download {index_url}. {error}")
@@ -1,18 +1,70 @@
 # -----------------------------------------------------------------------
 # Author: Marcelo Villa-Piñeros
 #
-# Purpose:
+# Purpose: Merges the individual bands of each Landsat 8 scene into a
+# single multiband raster reprojected to WGS 84.
+#
+# Notes: The bands are stacked in a virtual raster (VRT) that points to
+# the band files, which is then warped block by block straight to a
+# tiled and compressed GeoTIFF. Thus, the bands are never entirely
+# loaded into memory. Scenes are processed in parallel.
 # -----------------------------------------------------------------------
 import glob
 import os
+from concurrent.futures import ProcessPoolExecutor
 
-import numpy as np
 import pandas as pd
 from osgeo import gdal
 from osgeo import osr
 
 from src.utils.constants import L8_NODATA_VALUE
-from src.utils.functions import array_to_raster
+
+# Number of threads used by each warp and number of parallel processes
+# so that all the available cores are used.
+WARP_THREADS = 2
+MAX_WORKERS = max(1, os.cpu_count() // WARP_THREADS)
+
+# Maximum amount of memory (in MB) used by each warp's working buffers.
+WARP_MEMORY = 512
+
+
+def merge_and_reproject(band_files: list, save_to: str) -> str:
+    """
+    Stacks the bands of a scene and reprojects them to WGS 84.
+
+    Parameters
+    ----------
+    band_files: paths to the band files in the order they are stacked.
+    save_to:    output raster's file name.
+
+    Returns
+    -------
+    Path to the output raster.
+    """
+    vrt_options = gdal.BuildVRTOptions(
+        separate=True, srcNodata=L8_NODATA_VALUE, VRTNodata=L8_NODATA_VALUE
+    )
+    vrt = gdal.BuildVRT("", band_files, options=vrt_options)
+
+    # Reproject the virtual raster to WGS 84 (WKID: 4326) and save on
+    # disk.
+    new_sr = osr.SpatialReference()
+    new_sr.ImportFromEPSG(4326)
+    warp_options = gdal.WarpOptions(
+        format="GTiff",
+        dstSRS=new_sr.ExportToWkt(),
+        creationOptions=["TILED=YES", "COMPRESS=LZW", "BIGTIFF=IF_SAFER"],
+        outputType=gdal.GDT_UInt16,
+        dstNodata=L8_NODATA_VALUE,
+        multithread=True,
+        warpMemoryLimit=WARP_MEMORY,
+        warpOptions=[f"NUM_THREADS={WARP_THREADS}"]
+    )
+    out_ds = gdal.Warp(save_to, vrt, options=warp_options)
+    out_ds = None
+    vrt = None
+
+    return save_to
 
 
 if __name__ == "__main__":
@@ -23,6 +75,7 @@ if __name__ == "__main__":
     filepath = "results/csv/validation/reference_landsat8_scenes.csv"
     l8_scenes_subset = pd.read_csv(filepath)
 
+    scenes = []
     for i, row in l8_scenes_subset.iterrows():
 
         pr = str(row["pr"]).zfill(6)
@@ -31,41 +84,18 @@ if __name__ == "__main__":
 
         band_files = glob.glob(os.path.join(path_row_folder, f"{product_id}*.TIF"))
         band_files = sorted(band_files)
-        bands = []
-
-        for band_file in band_files:
-            ds = gdal.Open(band_file)
-            arr = ds.ReadAsArray()
-            bands.append(arr)
-
-        # Get last band's georeference information to create a new
-        # empty raster.
-        sr = ds.GetProjection()
-        gt = ds.GetGeoTransform()
-
-        # Create a 3D NumPy array from the list of bands (2D NumPy
-        # arrays).
-        bands = np.stack(bands)
-
-        # Create temporal in-memory raster with all the bands.
-        temp = array_to_raster(
-            bands, "temp", sr, gt, gdal.GDT_UInt16, driver="MEM", nd_val=L8_NODATA_VALUE
-        )
-
-        # Reproject temporal in-memory raster to WGS 84 (WKID: 4326)
-        # and save on disk.
-        new_sr = osr.SpatialReference()
-        new_sr.ImportFromEPSG(4326)
-        warp_options = gdal.WarpOptions(
-            format="GTiff",
-            dstSRS=new_sr.ExportToWkt(),
-            creationOptions=["COMPRESS=LZW"],
-            outputType=gdal.GDT_UInt16,
-            dstNodata=L8_NODATA_VALUE
-        )
         save_to = os.path.join(path_row_folder, f"{product_id}.tif")
-        gdal.Warp(save_to, temp, options=warp_options)
+        scenes.append((band_files, save_to))
+
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [
+            executor.submit(merge_and_reproject, band_files, save_to)
+            for band_files, save_to in scenes
+        ]
 
-        # Remove individual band GeoTIFF files.
-        for band_file in band_files:
-            os.remove(band_file)
+        # Remove individual band GeoTIFF files once each scene has been
+        # merged.
+        for future, (band_files, save_to) in zip(futures, scenes):
+            future.result()
+            for band_file in band_files:
+                os.remove(band_file)
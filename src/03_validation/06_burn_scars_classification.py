@@ -5,25 +5,275 @@
 # Tree) in order extract burn scars from Landsat 8 imagery.
 #
 # Notes: Scars whose area is below an arbitrary threshold (i.e.
-# AREA_THRESHOLD) are discarded.
+# AREA_THRESHOLD) are discarded before vectorizing them, adding up the
+# geodesic area of their pixels.
+#
+# Each scene is classified and filtered in tiles that are processed in
+# parallel. Tiles are read with a halo of half the majority filter's
+# size so the filtered result is the same as filtering the whole scene
+# at once. The filtered classification is written to disk tile by tile.
+# Removing small scars and vectorizing the rest are still done on the
+# whole classification, which is read back from disk, since scars may
+# span several tiles. Thus, that step holds a few arrays of the scene's
+# size in memory.
+#
+# Scenes are also processed in parallel and the scars of each scene are
+# written to their own partial file, so scenes that were already
+# processed are skipped if the script is run again.
 # -----------------------------------------------------------------------
-import functools
 import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple
 
 import geopandas
 import numpy as np
 import pandas as pd
-import pyproj
 import rasterio
 from rasterio.features import shapes
 from rasterio.plot import reshape_as_image
+from rasterio.transform import rowcol
+from rasterio.windows import Window
 from shapely.geometry import shape
-from shapely.ops import transform
-from skimage.filters.rank import majority
-from skimage.morphology import square
 from sklearn.tree import DecisionTreeClassifier
 
 from src.utils.constants import L8_NODATA_VALUE, FILTER_NEIGHBOURS, AREA_THRESHOLD
+from src.utils.functions import (
+    binary_majority,
+    get_block_windows,
+    get_pixel_areas,
+    remove_small_patches
+)
+from src.utils.runner import get_partial_filenames, run_tasks
+
+# Number of scenes processed at the same time, number of rows and
+# columns of each tile and number of parallel processes used to
+# classify the tiles of each scene.
+SCENE_WORKERS = 2
+TILE_SIZE = 1024
+MAX_WORKERS = max(1, os.cpu_count() // SCENE_WORKERS)
+
+# Scene and classifier used by each worker process (see init_worker).
+_worker = {}
+
+
+def init_worker(fn: str, clf: DecisionTreeClassifier) -> None:
+    """
+    Opens the scene and stores the trained classifier once per worker
+    process.
+
+    Parameters
+    ----------
+    fn:  path to the Landsat 8 scene.
+    clf: trained classifier.
+
+    Returns
+    -------
+    None
+    """
+    _worker["src"] = rasterio.open(fn)
+    _worker["clf"] = clf
+
+
+def classify_window(window: Window) -> np.ndarray:
+    """
+    Classifies a window of the scene and applies a majority filter to
+    the prediction.
+
+    Parameters
+    ----------
+    window: window of the scene to classify.
+
+    Returns
+    -------
+    2D array with the filtered classification of the window.
+    """
+    src = _worker["src"]
+    clf = _worker["clf"]
+
+    # Expand the window with a halo of half the filter's size, clipped
+    # to the scene's extent.
+    halo = FILTER_NEIGHBOURS // 2
+    row_off = max(window.row_off - halo, 0)
+    col_off = max(window.col_off - halo, 0)
+    row_end = min(window.row_off + window.height + halo, src.height)
+    col_end = min(window.col_off + window.width + halo, src.width)
+    halo_window = Window(col_off, row_off, col_end - col_off, row_end - row_off)
+
+    # Classification must be done on a 2D array where each row
+    # represents a pixel and each column represents a feature (band).
+    # Thus, the 3D array must be reshaped and the 2D prediction must be
+    # then reshaped back to match the window's 2D shape.
+    arr = src.read(window=halo_window)
+    prediction = clf.predict(reshape_as_image(arr).reshape(-1, src.count))
+    prediction = np.reshape(prediction, arr.shape[1:]).astype(np.uint8)
+
+    # Create a mask of NoData values in the original raster and
+    # change all predictions in the mask to 0 (i.e. unburned).
+    mask = np.all((arr == L8_NODATA_VALUE), axis=0)
+    prediction[mask] = 0
+
+    # Apply a majority filter using a rolling window to remove
+    # the salt-and-pepper noise on the prediction raster. Check
+    # https://en.wikipedia.org/wiki/Salt-and-pepper_noise for
+    # a description of this phenomenon.
+    prediction = binary_majority(prediction, FILTER_NEIGHBOURS)
+
+    # Remove the halo.
+    rows = slice(window.row_off - row_off, window.row_off - row_off + window.height)
+    cols = slice(window.col_off - col_off, window.col_off - col_off + window.width)
+
+    return prediction[rows, cols]
+
+
+def extract_samples(
+    src: rasterio.DatasetReader,
+    samples: geopandas.GeoDataFrame,
+    tile_size: int = TILE_SIZE
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gets the pixel values across all bands for each point in a set of
+    training samples.
+
+    Parameters
+    ----------
+    src:       Landsat 8 scene.
+    samples:   GeoDataFrame with the training points of the scene and
+               their class.
+    tile_size: number of rows and columns of the tiles read at a time.
+
+    Returns
+    -------
+    Tuple with a 2D array where each row represents a point and each
+    column represents a feature (band) and a 1D array with the class of
+    each point.
+
+    Notes
+    -----
+    Points are grouped by the tile of the scene (see get_block_windows)
+    they fall in and only the tiles with points are read, one at a time,
+    so memory use does not depend on how far apart the points are.
+    Points outside the scene get a value of 0 in every band.
+    """
+    rows, cols = rowcol(
+        src.transform, samples.geometry.x.values, samples.geometry.y.values
+    )
+    rows = np.asarray(rows)
+    cols = np.asarray(cols)
+    inside = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+
+    features = np.zeros((len(samples), src.count), dtype=src.dtypes[0])
+    tiles = (rows // tile_size) * -(-src.width // tile_size) + cols // tile_size
+    for i, (xoff, yoff, xsize, ysize) in enumerate(
+        get_block_windows(src.width, src.height, tile_size, tile_size)
+    ):
+        idx = np.flatnonzero(inside & (tiles == i))
+        if idx.size == 0:
+            continue
+        arr = src.read(window=Window(xoff, yoff, xsize, ysize))
+        features[idx] = arr[:, rows[idx] - yoff, cols[idx] - xoff].T
+
+    return features, samples["class"].values
+
+
+def classify_scene(fn: str, save_to: str, clf: DecisionTreeClassifier) -> None:
+    """
+    Classifies a scene tile by tile in parallel and writes the filtered
+    classification to a tiled GeoTIFF.
+
+    Parameters
+    ----------
+    fn:      path to the Landsat 8 scene.
+    save_to: output raster's file name.
+    clf:     trained classifier.
+
+    Returns
+    -------
+    None
+    """
+    with rasterio.open(fn) as src:
+        profile = src.profile
+        windows = [
+            Window(*window)
+            for window in get_block_windows(src.width, src.height, TILE_SIZE, TILE_SIZE)
+        ]
+
+    profile.update(
+        count=1,
+        dtype=rasterio.uint8,
+        nodata=None,
+        tiled=True,
+        blockxsize=256,
+        blockysize=256,
+        compress="lzw",
+    )
+    with rasterio.open(save_to, "w", **profile) as dst, ProcessPoolExecutor(
+        max_workers=MAX_WORKERS, initializer=init_worker, initargs=(fn, clf)
+    ) as executor:
+        for window, prediction in zip(windows, executor.map(classify_window, windows)):
+            dst.write(prediction, 1, window=window)
+
+
+def process_scene(
+    product_id: str,
+    acquisition_date: str,
+    path_row: str,
+    samples: geopandas.GeoDataFrame,
+    save_to: str
+) -> None:
+    """
+    Extracts the burn scars of a Landsat 8 scene.
+
+    Parameters
+    ----------
+    product_id:       Landsat 8 product ID of the scene.
+    acquisition_date: acquisition date of the scene.
+    path_row:         zero-padded path/row of the scene.
+    samples:          GeoDataFrame with the training points of the scene
+                      and their class.
+    save_to:          output GeoPackage file name.
+
+    Returns
+    -------
+    None
+    """
+    scene_fn = f"data/tif/landsat/{path_row}/{product_id}.tif"
+    with rasterio.open(scene_fn) as src:
+
+        # Get pixel values across all bands for each point in the
+        # training samples of the specific scene.
+        features, classes = extract_samples(src, samples)
+        transform, height, crs = src.transform, src.height, src.crs
+
+    # Train a Decision Tree algorithm using the training samples values
+    # and their class (i.e. burned and unburned).
+    clf = DecisionTreeClassifier()
+    clf.fit(features, classes)
+
+    # Use the trained Decision Tree to classify all pixels on the
+    # specific scene.
+    classification_fn = f"data/tif/landsat/{path_row}/{product_id}_classification.tif"
+    classify_scene(scene_fn, classification_fn, clf)
+    with rasterio.open(classification_fn) as classification:
+        prediction = classification.read(1)
+
+    # Keep only contiguous areas of burned pixels (i.e. pixels whose
+    # value is 1) with an area above an arbitrary threshold. Areas are
+    # computed on the ellipsoid to get a result in meters rather than
+    # degrees.
+    pixel_areas = get_pixel_areas(transform, height)
+    mask = remove_small_patches(prediction == 1, pixel_areas, AREA_THRESHOLD)
+
+    # Vectorize the remaining burned areas.
+    features = shapes(prediction, mask=mask, transform=transform)
+    scars = [
+        {"productId": product_id, "date": acquisition_date, "geometry": shape(geom)}
+        for geom, _ in features
+    ]
+    scars = geopandas.GeoDataFrame(
+        scars, columns=["productId", "date", "geometry"], crs=crs
+    )
+    scars.to_file(save_to, driver="GPKG")
+
 
 if __name__ == "__main__":
 
@@ -36,92 +286,45 @@ if __name__ == "__main__":
     training_samples_filepath = "data/shp/scars/training_samples.shp"
     training_samples = geopandas.read_file(training_samples_filepath)
 
-    # Create empty GeoDataFrame to store burn scars geometries.
-    scars = geopandas.GeoDataFrame(columns=["productId", "date"])
+    # Split the training samples by scene only once.
+    scene_samples = dict(tuple(training_samples.groupby("productId")))
 
+    # Scenes without training samples cannot be classified, so they are
+    # reported and skipped.
+    tasks = {}
     for _, scene in l8_scenes_subset.iterrows():
-
-        # Open specific Landsat 8 scene.
-        acquisition_date = scene["acquisitionDate"]
         product_id = scene["productId"]
-        path_row = str(scene["pr"]).zfill(6)
-        src = rasterio.open(f"data/tif/landsat/{path_row}/{product_id}.tif")
+        samples = scene_samples.get(product_id)
+        if samples is None:
+            print(f"Skipping scene {product_id}. It has no training samples.")
+            continue
+        tasks[product_id] = (
+            product_id,
+            scene["acquisitionDate"],
+            str(scene["pr"]).zfill(6),
+            samples,
+        )
 
-        # Filter training samples to match specific Landsat 8 scene.
-        scene_samples = training_samples.query(f"productId == '{product_id}'")
-        scene_samples = scene_samples.reset_index(drop=True)
-        extra_cols = [f"b{i+1}" for i in range(src.count)]
-        scene_samples[extra_cols] = np.nan
+    # Extract the burn scars of each scene, skipping the scenes that
+    # were already processed.
+    partial_folder = "data/shp/scars/partial"
+    failed = []
+    for product_id, error in run_tasks(
+        process_scene, tasks, partial_folder, ".gpkg", SCENE_WORKERS
+    ):
+        if error is not None:
+            print(f"Could not process scene {product_id}. {error}")
+            failed.append(product_id)
 
-        # Get pixel values across all bands for each point in the
-        # training samples of the specific scene.
-        x_coords = scene_samples.geometry.x
-        y_coords = scene_samples.geometry.y
-        for i, values in enumerate(src.sample(zip(x_coords, y_coords))):
-            scene_samples.loc[i, extra_cols] = values
-
-        # Train a Decision Tree algorithm using the training samples
-        # values and their class (i.e. burned and unburned).
-        clf = DecisionTreeClassifier()
-        clf.fit(scene_samples[extra_cols], scene_samples["class"])
-
-        # Used the trained Decision Tree to classify all pixels on the
-        # specific scene. Classification must be done on a 2D array
-        # where each row represents a pixel and each column represents
-        # a feature (band). Thus, the 3D array must be reshaped and the
-        # 2D prediction must be then reshaped back to match the original
-        # raster 2D shape (the raster is not 3D anymore as it looses the
-        # depth and has only one band).
-        arr = src.read()
-        prediction = clf.predict(reshape_as_image(arr).reshape(-1, src.count))
-        prediction = np.reshape(prediction, src.shape).astype(np.uint8)
-
-        # Create a mask of NoData values in the original raster and
-        # change all predictions in the mask to 0 (i.e. unburned).
-        mask = np.all((arr == L8_NODATA_VALUE), axis=0)
-        prediction[mask] = 0
-
-        # Apply a majority filter using a rolling window to remove
-        # the salt-and-pepper noise on the prediction raster. Check
-        # https://en.wikipedia.org/wiki/Salt-and-pepper_noise for
-        # a description of this phenomenon.
-        prediction = majority(prediction, square(FILTER_NEIGHBOURS))
-
-        # Vectorize contiguous areas of burned pixels (i.e. pixels
-        # whose value is 1).
-        features = shapes(prediction, mask=(prediction == 1), transform=src.transform)
-
-        for feature in features:
-
-            # Create a Shapely geometry of the polygon and compute
-            # its area in a planar spatial reference to get a result
-            # in meters rather than degrees.
-            geom = shape(feature[0])
-            transformed_geom = transform(
-                functools.partial(
-                    pyproj.transform,
-                    pyproj.Proj("EPSG:4326"),
-                    pyproj.Proj(proj="aea", lat_1=geom.bounds[1], lat_2=geom.bounds[3]),
-                ),
-                geom
-            )
-            area = transformed_geom.area
-
-            # Keep only polygons with an area above an arbitrary
-            # threshold.
-            if area >= AREA_THRESHOLD:
-                scars = scars.append(
-                    {
-                        "productId": product_id,
-                        "date": acquisition_date,
-                        "geometry": geom,
-                    },
-                    ignore_index=True
-                )
-
-    # Add spatial reference to the GeoDataFrame, fix potential topology
-    # errors by running a 0 distance buffer and export it to a shapefile
-    # on disk.
-    scars.crs = src.crs
+    if failed:
+        raise SystemExit(f"{len(failed)} scenes failed. Run the script again.")
+
+    # Merge the burn scars of all the scenes, fix potential topology
+    # errors by running a 0 distance buffer and export them to a
+    # shapefile on disk.
+    partial_filenames = get_partial_filenames(partial_folder, list(tasks), ".gpkg")
+    scars = pd.concat(
+        [geopandas.read_file(fn) for fn in partial_filenames], ignore_index=True
+    )
     scars.geometry = scars.geometry.buffer(0)
     scars.to_file("data/shp/scars/scars.shp")
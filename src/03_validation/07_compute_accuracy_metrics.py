@@ -1,7 +1,17 @@
 # -----------------------------------------------------------------------
 # Author: Marcelo Villa-Piñeros
 #
-# Purpose:
+# Purpose: Computes the accuracy metrics of the MCD64A1 burned area
+# product using the burn scars extracted from Landsat 8 scenes as
+# reference.
+#
+# Notes: The proportion of each MODIS pixel covered by burn scars is
+# computed by rasterizing the scars on a supersampled grid aligned with
+# the MODIS grid (see get_fractional_coverage).
+#
+# Scenes are processed in parallel and the metrics of each scene are
+# written to their own partial file, so scenes that were already
+# processed are skipped if the script is run again.
 # -----------------------------------------------------------------------
 import os
 
@@ -9,8 +19,94 @@ import geopandas
 import numpy as np
 import pandas as pd
 import rioxarray
-import xarray as xr
-from shapely.geometry import mapping, MultiPolygon, Polygon
+from shapely.geometry import mapping
+
+from src.utils.burn_cube import BurnDayCube
+from src.utils.functions import get_fractional_coverage
+from src.utils.runner import get_partial_filenames, run_tasks
+
+# Number of subpixels along each dimension of a MODIS pixel used to
+# compute the proportion covered by burn scars.
+SUPERSAMPLING_FACTOR = 20
+
+# Number of scenes processed at the same time.
+MAX_WORKERS = os.cpu_count()
+
+
+def process_scene(
+    product_id: str,
+    acquisition_date: str,
+    scars: geopandas.GeoDataFrame,
+    tile: geopandas.GeoDataFrame,
+    aoi: geopandas.GeoDataFrame,
+    ba_filepath: str,
+    save_to: str
+) -> None:
+    """
+    Computes the proportions of the error matrix of the MCD64A1 burned
+    area product for a Landsat 8 scene.
+
+    Parameters
+    ----------
+    product_id:       Landsat 8 product ID of the scene.
+    acquisition_date: acquisition date of the scene.
+    scars:            GeoDataFrame with the burn scars of the scene.
+    tile:             GeoDataFrame with the WRS-2 tile of the scene.
+    aoi:              GeoDataFrame with the area of interest.
+    ba_filepath:      path to the MCD64A1 NetCDF4 file.
+    save_to:          output CSV file name.
+
+    Returns
+    -------
+    None
+    """
+    burn_days = BurnDayCube.from_cube(ba_filepath)
+
+    # Find the pixels that burned over a one month span before the
+    # acquisition date.
+    upper_date = pd.to_datetime(acquisition_date) + pd.Timedelta(2, unit="D")
+    lower_date = upper_date - pd.Timedelta(32, unit="D")
+    burned_pixels = burn_days.burned_between(lower_date, upper_date).astype(int)
+
+    burned_pixels = burned_pixels.rio.write_crs("epsg:4326")
+    burned_pixels = burned_pixels.rio.write_nodata(-1)
+
+    # Clip burned area data to tile.
+    tile_geom = tile.geometry.apply(mapping)
+    tile_burned_pixels = burned_pixels.rio.clip(tile_geom)
+
+    # Clip burned area data to AOI.
+    aoi_geom = aoi.geometry.apply(mapping)
+    tile_burned_pixels = tile_burned_pixels.rio.clip(aoi_geom)
+
+    # Clip scars to tile and AOI.
+    tile_scars = geopandas.clip(scars, tile)
+    tile_scars = geopandas.clip(tile_scars, aoi)
+
+    # Compute the proportion of each pixel covered by burn scars.
+    categories = tile_burned_pixels.values
+    proportions = get_fractional_coverage(
+        tile_scars.geometry,
+        tile_burned_pixels.rio.transform(),
+        categories.shape,
+        SUPERSAMPLING_FACTOR
+    )
+
+    # Pixels outside the tile or the AOI are not taken into account.
+    n = np.count_nonzero(categories != -1)
+    burned = categories == 1
+    unburned = categories == 0
+
+    metrics = pd.DataFrame(
+        {
+            "productId": [product_id],
+            "p11": [proportions[burned].sum() / n],
+            "p12": [(1 - proportions[burned]).sum() / n],
+            "p21": [proportions[unburned].sum() / n],
+            "p22": [(1 - proportions[unburned]).sum() / n],
+        }
+    )
+    metrics.to_csv(save_to, index=False)
 
 
 if __name__ == "__main__":
@@ -22,131 +118,47 @@ if __name__ == "__main__":
     wrs2_grid = geopandas.read_file("data/shp/landsat/WRS2_descending_orinoquia.shp")
     aoi = geopandas.read_file("data/shp/regions/orinoquia_ncs.shp")
 
+    # Compute (or check) the cached burn dates before the workers use
+    # them.
     ba_filepath = "data/nc/MODIS/MCD64A1/MCD64A1_500m_ncs.nc"
-    burn_date = xr.open_dataset(ba_filepath, mask_and_scale=False)["Burn_Date"]
+    BurnDayCube.from_cube(ba_filepath)
 
     l8_scenes_subset_filepath = "results/csv/validation/reference_landsat8_scenes.csv"
     l8_scenes_subset = pd.read_csv(l8_scenes_subset_filepath)
 
-    cols = ["productId", "p11", "p12", "p21", "p22"]
-    metrics = pd.DataFrame(columns=cols)
+    # Split the scars by scene only once.
+    scene_scars = dict(tuple(scars.groupby("productId")))
 
+    tasks = {}
     for _, scene in l8_scenes_subset.iterrows():
-
-        # Open specific Landsat 8 scene.
-        acquisition_date = scene["acquisitionDate"]
         product_id = scene["productId"]
         pr = str(scene["pr"]).zfill(6)
-
-        print(f"Processing scene {product_id}...")
-
-        # Filter burned area data by date over a one month span.
-        upper_date = pd.to_datetime(acquisition_date) + pd.Timedelta(2, unit="D")
-        lower_date = upper_date - pd.Timedelta(32, unit="D")
-        lower_date_str = lower_date.strftime("%Y-%m")
-        upper_date_str = upper_date.strftime("%Y-%m")
-        burn_date_subset = burn_date.sel(time=slice(lower_date_str, upper_date_str))
-
-        mask1 = burn_date_subset > 0
-
-        upper_doy = upper_date.dayofyear
-        lower_doy = lower_date.dayofyear
-        if lower_doy < upper_doy:
-            mask2 = (burn_date_subset >= lower_doy) & (burn_date_subset <= upper_doy)
-        else:
-            mask2 = (burn_date_subset >= lower_doy) | (burn_date_subset <= upper_doy)
-
-        burned_pixels = (mask1 & mask2).any(axis=0).astype(int)
-
-        burned_pixels = burned_pixels.rio.write_crs("epsg:4326")
-        burned_pixels = burned_pixels.rio.write_nodata(-1)
-
-        # Clip burned area data to tile.
-        tile_geom = wrs2_grid.query(f"PR == '{pr}'").geometry.apply(mapping)
-        tile_burned_pixels = burned_pixels.rio.clip(tile_geom)
-
-        # Clip burned area data to AOI.
-        aoi_geom = aoi.geometry.apply(mapping)
-        tile_burned_pixels = tile_burned_pixels.rio.clip(aoi_geom)
-
-        # Filter scars.
-        scars_subset = scars.query(f"productId == '{product_id}'")
-        wrs2_tile = wrs2_grid.query(f"PR == '{pr}'")
-        tile_scars = geopandas.clip(scars_subset, wrs2_tile)
-        tile_scars = geopandas.clip(tile_scars, aoi)
-        tile_scars = tile_scars.explode().reset_index(drop=True)
-        combined_tile_scars = MultiPolygon(tile_scars.geometry.values)
-
-        # Create raster grid.
-        cols = tile_burned_pixels.rio.width
-        rows = tile_burned_pixels.rio.height
-        gt = tile_burned_pixels.rio.transform()
-        pixel_width = gt[0]
-        pixel_height = gt[4]
-        xmin, ymin, xmax, ymax = tile_burned_pixels.rio.bounds()
-        x_coords = xmin + np.arange(cols) * pixel_width
-        y_coords = ymax + np.arange(rows) * pixel_height
-
-        geometries = []
-        categories = []
-        for i, x in enumerate(x_coords):
-            for j, y in enumerate(y_coords):
-                cat = tile_burned_pixels.values[j, i]
-                if cat != -1:
-                    geom = Polygon(
-                        [
-                            (x, y),
-                            (x + pixel_width, y),
-                            (x + pixel_width, y + pixel_height),
-                            (x, y + pixel_height),
-                        ]
-                    )
-                    geometries.append(geom)
-                    categories.append(cat)
-
-        tile_grid = geopandas.GeoDataFrame(
-            {"category": categories, "geometry": geometries}, crs="epsg:4326"
-        )
-        tile_grid["intersects"] = tile_grid.intersects(combined_tile_scars)
-        tile_grid["proportion"] = np.nan
-
-        for i, subtile in tile_grid.iterrows():
-            if subtile["intersects"]:
-                intersection = subtile.geometry.intersection(combined_tile_scars)
-                proportion = intersection.area / subtile.geometry.area
-                tile_grid.loc[i, "proportion"] = proportion
-            else:
-                tile_grid.loc[i, "proportion"] = 0
-
-        tile_grid[["p11", "p12", "p21", "p22"]] = np.nan
-
-        tile_grid.loc[tile_grid.eval("category == 1"), "p11"] = tile_grid.query(
-            "category == 1"
-        )["proportion"]
-        tile_grid.loc[tile_grid.eval("category == 1"), "p12"] = (
-            1 - tile_grid.query("category == 1")["proportion"]
-        )
-        tile_grid.loc[tile_grid.eval("category == 1"), "p21"] = 0
-        tile_grid.loc[tile_grid.eval("category == 1"), "p22"] = 0
-
-        tile_grid.loc[tile_grid.eval("category == 0"), "p11"] = 0
-        tile_grid.loc[tile_grid.eval("category == 0"), "p12"] = 0
-        tile_grid.loc[tile_grid.eval("category == 0"), "p21"] = tile_grid.query(
-            "category == 0"
-        )["proportion"]
-        tile_grid.loc[tile_grid.eval("category == 0"), "p22"] = (
-            1 - tile_grid.query("category == 0")["proportion"]
+        tasks[product_id] = (
+            product_id,
+            scene["acquisitionDate"],
+            scene_scars.get(product_id, scars.iloc[:0]),
+            wrs2_grid.query(f"PR == '{pr}'"),
+            aoi,
+            ba_filepath,
         )
 
-        metrics = metrics.append(
-            {
-                "productId": product_id,
-                "p11": tile_grid["p11"].mean(),
-                "p12": tile_grid["p12"].mean(),
-                "p21": tile_grid["p21"].mean(),
-                "p22": tile_grid["p22"].mean(),
-            }, ignore_index=True
-        )
+    # Compute the metrics of each scene, skipping the scenes that were
+    # already processed.
+    partial_folder = "results/csv/validation/partial"
+    failed = []
+    for product_id, error in run_tasks(
+        process_scene, tasks, partial_folder, ".csv", MAX_WORKERS
+    ):
+        if error is not None:
+            print(f"Could not process scene {product_id}. {error}")
+            failed.append(product_id)
+
+    if failed:
+        raise SystemExit(f"{len(failed)} scenes failed. Run the script again.")
+
+    # Merge the metrics of all the scenes.
+    partial_filenames = get_partial_filenames(partial_folder, list(tasks), ".csv")
+    metrics = pd.concat([pd.read_csv(fn) for fn in partial_filenames], ignore_index=True)
 
     metrics["OA"] = metrics["p11"] + metrics["p22"]
     metrics["Ce"] = metrics["p12"] / (metrics["p11"] + metrics["p12"])
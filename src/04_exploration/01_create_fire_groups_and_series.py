@@ -10,8 +10,8 @@ import os
 
 import numpy as np
 import pandas as pd
-import xarray as xr
 
+from src.utils.burn_cube import BurnCubeStats
 from src.utils.constants import REGIONS, AREA_FACTOR
 
 
@@ -28,22 +28,18 @@ if __name__ == "__main__":
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
 
-        window_ds = xr.open_dataset(
-            f"data/nc/MODIS/MCD64A1/{region_name}/MCD64A1_500m.nc",
-            mask_and_scale=False,
-        )
-
-        # Create a boolean mask of burned pixels. Any pixel with a Burn
-        # Date value greater than zero is, by definition, a pixel that
-        # burned on a given month.
-        burned = window_ds["Burn_Date"] > 0
+        # Burn statistics are computed in a single pass over the data
+        # cube (or loaded from the cache if they were already computed
+        # and updated with the new months of the data cube, if any).
+        fn = f"data/nc/MODIS/MCD64A1/{region_name}/MCD64A1_500m.nc"
+        stats = BurnCubeStats.from_cube(fn)
 
         # ---------- Series ----------
         save_to = os.path.join(output_folder, "fire_series.xlsx")
         with pd.ExcelWriter(save_to) as writer:
 
             # Compute monthly burned area for the whole date range.
-            monthly_series = burned.sum(axis=(1, 2)).to_pandas() * AREA_FACTOR
+            monthly_series = stats.monthly_series * AREA_FACTOR
             monthly_series.name = "area"
             monthly_series.to_excel(writer, sheet_name="Monthly")
 
@@ -51,26 +47,11 @@ if __name__ == "__main__":
             # is more complex because the original NetCDF4 data has a
             # monthly resolution. However, burned pixels have a burning
             # date represented as the day of the year in which they
-            # burned. Therefore, it is possible to compute the number
-            # of pixels that burned for each day on a given year.
-            start = window_ds.time.dt.year.values.min()
-            end = window_ds.time.dt.year.values.max()
-            date_range = pd.date_range(
-                str(start), str(end + 1), freq="D", closed="left"
-            )
-            daily_series = pd.Series(None, index=date_range, dtype=np.float)
-            daily_series.index.name = "time"
+            # burned, which is converted to an absolute date. Therefore,
+            # it is possible to compute the number of pixels that burned
+            # for each day.
+            daily_series = stats.daily_series * AREA_FACTOR
             daily_series.name = "area"
-
-            for year in window_ds.groupby("time.year").groups.keys():
-                year_window_ds = window_ds.sel(time=str(year))
-                days = year_window_ds["Burn_Date"].values
-                unique_days, counts = np.unique(days[days > 0], return_counts=True)
-                date_stings = np.char.add(unique_days.astype("str"), f"-{year}")
-                counts = pd.Series(counts, pd.to_datetime(date_stings, format="%j-%Y"))
-                daily_series.loc[counts.index] = counts * AREA_FACTOR
-
-            daily_series = daily_series.fillna(0)
             daily_series.to_excel(writer, sheet_name="Daily")
 
         # ---------- Groups ----------
@@ -4,17 +4,43 @@
 # Purpose: Computes the return interval pixel-wise for each window. The
 # return interval is computed following the equation: RI = (n + 1) / m,
 # where n corresponds to the number of years on record and m corresponds
-# to the number of burned pixels along the time dimension.
+# to the number of burned pixels along the time dimension. The return
+# interval is also computed for sliding windows of years, giving a
+# raster with a band for each window.
+#
+# Notes: If the per-year burn counts of a window fit in memory (see
+# MAX_CACHE_SIZE), they are taken from the cached burn statistics (see
+# BurnCubeStats), which only read the months appended to the data cube
+# since they were cached. Otherwise, the data cube is read in spatial
+# tiles that are processed in parallel. Either way, the output is
+# written as it is computed and converted to a Cloud-Optimized GeoTIFF
+# (COG), so its overviews can be read when plotting.
 # -----------------------------------------------------------------------
 import os
 
 import numpy as np
+import rioxarray
 import xarray as xr
 from osgeo import gdalconst
+from rasterio.crs import CRS
 
+from src.utils.burn_cube import (
+    BurnCubeStats,
+    get_sliding_years,
+    return_interval_blocks,
+    sliding_return_interval_blocks
+)
 from src.utils.constants import REGIONS, NODATA_VALUE
-from src.utils.functions import array_to_raster
+from src.utils.functions import blocks_to_raster
+
+# Number of rows and columns of each tile (a multiple of the data
+# cubes' spatial chunk size) and number of years of each sliding window.
+BLOCK_SIZE = 512
+WINDOW_YEARS = 5
 
+# Maximum size (in bytes) of the per-year burn counts of a window for
+# them to be taken from the cached burn statistics.
+MAX_CACHE_SIZE = 2 * 1024 ** 3
 
 if __name__ == "__main__":
 
@@ -25,41 +51,63 @@ if __name__ == "__main__":
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    for region in REGIONS:
+    options = ["COMPRESS=LZW", "BIGTIFF=IF_SAFER"]
 
-        window_ds = xr.open_dataset(
-            f"data/nc/MODIS/MCD64A1/MCD64A1_500m_{region['name']}.nc",
-            mask_and_scale=False,
-        )
+    for region in REGIONS:
 
-        # Compute the number of years from the first to the last date of
-        # recorded data in the NetCDF4 file.
-        nyears = np.diff(window_ds.time.dt.year[[0, -1]])
+        fn = f"data/nc/MODIS/MCD64A1/{region['name']}/MCD64A1_500m.nc"
 
-        # Compute per pixel number of burn events (i.e. number of times
-        # the pixel's Burn Date value is greater than 0). The result is
-        # masked to avoid divisions by zero in NoData pixels or pixels
-        # where no burn events were found.
-        burn_events = (window_ds["Burn_Date"] > 0).sum(axis=0)
-        burn_events = np.ma.array(burn_events, mask=(burn_events == 0))
+        # Get the output GeoTIFF file's metadata from the NetCDF4 file
+        # without reading its data.
+        with xr.open_dataset(fn, mask_and_scale=False) as ds:
+            da = ds["Burn_Date"]
+            da = da.rio.set_spatial_dims(x_dim=da.dims[2], y_dim=da.dims[1])
+            rows, cols = da.shape[1:]
+            sr = (da.rio.crs or CRS.from_epsg(4326)).to_wkt()
+            gt = da.rio.transform().to_gdal()
+            nyears = np.unique(da["time"].dt.year.values).size
 
-        # Compute return interval with the (n + 1) / n equation and fill
-        # the masked pixels with a predefined NoData value.
-        return_interval = (nyears + 1) / burn_events
-        return_interval = return_interval.filled(NODATA_VALUE)
+        # The cached per-year burn counts are stored as 8-bit integers.
+        if nyears * rows * cols <= MAX_CACHE_SIZE:
+            year_sum = BurnCubeStats.from_cube(fn).year_sum.values
+        else:
+            year_sum = None
 
-        # Create output GeoTIFF file using metadata from the NetCDF4
-        # file.
+        # Return interval for the whole record. Pixels where no burn
+        # events were found are filled with a predefined NoData value.
         save_to = os.path.join(output_folder, f"RI_500m_{region['name']}.tif")
-        sr = window_ds.rio.crs.to_wkt()
-        gt = window_ds.rio.transform()
-        array_to_raster(
-            return_interval,
+        blocks_to_raster(
+            return_interval_blocks(fn, BLOCK_SIZE, year_sum=year_sum),
+            save_to,
+            cols,
+            rows,
+            sr,
+            gt,
+            gdalconst.GDT_Float32,
+            nd_val=NODATA_VALUE,
+            options=options,
+            cog=True,
+        )
+
+        # Return interval for each sliding window of years. Each band is
+        # described with the window's last year.
+        years = get_sliding_years(fn, WINDOW_YEARS)
+        save_to = os.path.join(
+            output_folder, f"RI_500m_{region['name']}_{WINDOW_YEARS}y.tif"
+        )
+        blocks_to_raster(
+            sliding_return_interval_blocks(
+                fn, WINDOW_YEARS, BLOCK_SIZE, year_sum=year_sum
+            ),
             save_to,
+            cols,
+            rows,
             sr,
             gt,
-            gdtype=gdalconst.GDT_Float32,
-            driver="GTiff",
+            gdalconst.GDT_Float32,
+            bands=len(years),
             nd_val=NODATA_VALUE,
-            options=["COMPRESS=LZW"],
+            options=options,
+            cog=True,
+            descriptions=[str(year) for year in years],
         )
@@ -8,61 +8,86 @@
 # the 75th (25th) percentile plus (minus) 1.5 times the IQR. The IQR is
 # the difference between the 75 percentile (i.e. the third quartile) and
 # the 25th percentile (the first quartile).
+#
+# Outliers are also detected for every cell of a coarser grid using the
+# monthly fraction of burned pixels in each cell, giving a per-cell
+# anomaly cube for each window.
+#
+# Notes: The outliers of all the series (i.e. all the windows or all
+# the cells of a window) are detected at once (see
+# get_month_wise_outliers).
 # -----------------------------------------------------------------------
 import os
 
 import numpy as np
 import pandas as pd
-from scipy import stats
 
+from src.utils.burn_cube import get_burned_fraction
 from src.utils.constants import REGIONS
+from src.utils.functions import get_month_wise_outliers, set_cube_encoding
 
+# Number of rows and columns of 500 m pixels of each cell of the grid
+# used to build the anomaly cubes (i.e. 5 km cells).
+AGGREGATION_FACTOR = 10
 
-if __name__ == "__main__":
 
-    # Disable SettingWithCopyWarning. In this case it is safe to disable
-    # the warning.
-    pd.options.mode.chained_assignment = None
+if __name__ == "__main__":
 
     # Project's root
     os.chdir("../..")
 
+    # ---------- Regional series ----------
+    series = []
     for region in REGIONS:
 
-        output_folder = f"results/csv/{region['name']}"
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-
         series_filepath = f"results/xlsx/{region['name']}/fire_series.xlsx"
         monthly_series = pd.read_excel(series_filepath, sheet_name="Monthly")
 
         # Make sure the time column in the monthly series is interpreted
         # as datetime.
         monthly_series["time"] = pd.to_datetime(monthly_series["time"])
+        series.append(monthly_series.set_index("time")["area"])
+
+    # Table with the monthly series of every window as columns.
+    areas = pd.concat(series, axis=1)
+    below, above = get_month_wise_outliers(areas.values, areas.index.month)
 
-        # Add extra columns to classify outliers.
-        extra_columns = ["is_outlier", "is_below", "is_above"]
-        monthly_series[extra_columns] = np.nan
+    for i, region in enumerate(REGIONS):
 
-        for month in monthly_series.time.dt.month.unique():
+        output_folder = f"results/csv/{region['name']}"
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
 
-            month_observations = monthly_series.query(f"time.dt.month == {month}")
-            burned_area = month_observations["area"]
+        monthly_series = pd.DataFrame(
+            {
+                "time": areas.index,
+                "area": areas.iloc[:, i].values,
+                "is_outlier": below[:, i] | above[:, i],
+                "is_below": below[:, i],
+                "is_above": above[:, i],
+            }
+        )
 
-            # Compute the IQR and the first and third quartiles.
-            iqr = stats.iqr(burned_area)
-            q1 = np.percentile(burned_area, 25)
-            q3 = np.percentile(burned_area, 75)
+        save_to = os.path.join(output_folder, "month_wise_anomalies.csv")
+        monthly_series.to_csv(save_to, index=False)
 
-            # Detect outliers below or above the thresholds.
-            outliers_below = burned_area < q1 - (1.5 * iqr)
-            outliers_above = burned_area > q3 + (1.5 * iqr)
+    # ---------- Per-cell anomaly cubes ----------
+    for region in REGIONS:
 
-            month_observations["is_outlier"] = outliers_below | outliers_above
-            month_observations["is_below"] = outliers_below
-            month_observations["is_above"] = outliers_above
+        fn = f"data/nc/MODIS/MCD64A1/{region['name']}/MCD64A1_500m.nc"
+        fraction = get_burned_fraction(fn, AGGREGATION_FACTOR)
 
-            monthly_series.update(month_observations[extra_columns])
+        # Anomalies are 1 for outliers above the thresholds, -1 for
+        # outliers below the thresholds and 0 otherwise.
+        below, above = get_month_wise_outliers(
+            fraction.values, fraction["time"].dt.month.values
+        )
+        anomaly = above.astype(np.int8) - below.astype(np.int8)
 
-        save_to = os.path.join(output_folder, "month_wise_anomalies.csv")
-        monthly_series.to_csv(save_to, index=False)
+        ds = fraction.to_dataset()
+        ds["anomaly"] = (fraction.dims, anomaly)
+
+        y_dim, x_dim = fraction.dims[1:]
+        ds = set_cube_encoding(ds, x_dim=x_dim, y_dim=y_dim)
+        save_to = os.path.join(os.path.dirname(fn), "MCD64A1_5km_anomalies.nc")
+        ds.to_netcdf(save_to)
@@ -4,13 +4,52 @@
 # Purpose: Determines whether there is an interannual trend amongst
 # burned area values for each window. The trend is determined by running
 # the Mann-Kendall trend test on the yearly median burned area values.
+# The test is also run for every pixel on the annual burned fraction
+# (i.e. the fraction of each year's months in which the pixel burned),
+# writing Kendall's tau, p-value and Sen's slope rasters.
+#
+# Notes: The per-pixel test is vectorized (see mann_kendall and
+# sens_slope) and run on spatial tiles in parallel.
 # -----------------------------------------------------------------------
 import os
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
 import pymannkendall as mk
+from osgeo import gdalconst
+
+from src.utils.burn_cube import BurnCubeStats
+from src.utils.constants import REGIONS, NODATA_VALUE
+from src.utils.functions import (
+    array_to_raster,
+    get_block_windows,
+    mann_kendall,
+    sens_slope
+)
+
+# Number of rows and columns of each tile.
+TILE_SIZE = 256
+
+
+def compute_trend(arr: np.ndarray) -> np.ndarray:
+    """
+    Runs the Mann-Kendall trend test and computes Sen's slope for every
+    pixel of a tile.
 
-from src.utils.constants import REGIONS
+    Parameters
+    ----------
+    arr: 3D array (year, lat, lon) with the annual burned fraction.
+
+    Returns
+    -------
+    3D array with Kendall's tau, the p-value and Sen's slope of each
+    pixel.
+    """
+    _, p, _, tau, _, _ = mann_kendall(arr, alpha=0.05)
+    slope = sens_slope(arr)
+
+    return np.stack([tau, p, slope]).astype(np.float32)
 
 
 if __name__ == "__main__":
@@ -57,3 +96,52 @@ if __name__ == "__main__":
 
     save_to = os.path.join(output_folder, "burned_area_interannual_season_trend.csv")
     df.to_csv(save_to, index=False)
+
+    # ---------- Per-pixel trend ----------
+    output_folder = "data/tif/trend"
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    for region in REGIONS:
+
+        fn = f"data/nc/MODIS/MCD64A1/{region['name']}/MCD64A1_500m.nc"
+        stats = BurnCubeStats.from_cube(fn)
+
+        # Divide the number of months each pixel burned in each year by
+        # the number of months of that year in the data cube.
+        months = stats.ds["time"].dt.year.to_pandas().value_counts()
+        months = months.reindex(stats.years).values
+        fraction = stats.year_sum.values / months[:, np.newaxis, np.newaxis]
+
+        rows, cols = fraction.shape[1:]
+        windows = list(get_block_windows(cols, rows, TILE_SIZE, TILE_SIZE))
+        tiles = (
+            fraction[:, yoff:yoff + ysize, xoff:xoff + xsize]
+            for xoff, yoff, xsize, ysize in windows
+        )
+
+        trend = np.empty((3, rows, cols), dtype=np.float32)
+        with ProcessPoolExecutor() as executor:
+            for (xoff, yoff, xsize, ysize), result in zip(
+                windows, executor.map(compute_trend, tiles)
+            ):
+                trend[:, yoff:yoff + ysize, xoff:xoff + xsize] = result
+
+        # Pixels that never burned have no trend.
+        trend[:, ~stats.burn_mask.values] = NODATA_VALUE
+
+        sr = stats.burn_sum.rio.crs.to_wkt()
+        gt = stats.burn_sum.rio.transform().to_gdal()
+        for name, arr in zip(["TAU", "P", "SLOPE"], trend):
+            save_to = os.path.join(output_folder, f"{name}_500m_{region['name']}.tif")
+            out_ds = array_to_raster(
+                arr,
+                save_to,
+                sr,
+                gt,
+                gdtype=gdalconst.GDT_Float32,
+                driver="GTiff",
+                nd_val=NODATA_VALUE,
+                options=["COMPRESS=LZW"],
+            )
+            out_ds = None
@@ -7,9 +7,8 @@ import os
 
 import numpy as np
 import rasterio
-import rioxarray
-import xarray as xr
 
+from src.utils.burn_cube import BurnCubeStats
 from src.utils.constants import REGIONS
 
 if __name__ == "__main__":
@@ -23,9 +22,9 @@ if __name__ == "__main__":
     for i, region in enumerate(REGIONS):
 
         fn = f"data/nc/MODIS/MCD64A1/{region.get('name')}/MCD64A1_500m.nc"
-        da = xr.open_dataset(fn, mask_and_scale=False)["Burn_Date"]
+        da = BurnCubeStats.from_cube(fn).burn_sum
 
-        burn_sum = (da > 0).sum(axis=0).values
+        burn_sum = da.values
 
         with rasterio.open(
             os.path.join(output_folder, f"BS_500m_{region.get('name')}.tif"),
@@ -5,9 +5,9 @@ import os
 
 import numpy as np
 import pandas as pd
-import xarray as xr
 from osgeo import gdal
 
+from src.utils.burn_cube import BurnCubeStats
 from src.utils.constants import (
     REGIONS,
     LANDCOVER_MAP,
@@ -25,7 +25,7 @@ if __name__ == "__main__":
 
         region_name = region.get("name")
         burn_fn = f"data/nc/MODIS/MCD64A1/{region_name}/MCD64A1_500m.nc"
-        burn_da = xr.open_dataset(burn_fn, mask_and_scale=False)["Burn_Date"]
+        stats = BurnCubeStats.from_cube(burn_fn)
         landcover_folder = f"data/tif/landcover/{region_name}"
 
         df = pd.DataFrame(columns=["year", "landcover", "interval"])
@@ -40,9 +40,9 @@ if __name__ == "__main__":
                 str(int(year) - LANDCOVER_PADDING),
                 str(int(year) + LANDCOVER_PADDING)
             )
-            da = burn_da.sel(time=slice(*period))
-            burn_mask = (da > 0).any(axis=0)
-            burn_mean = (da > 0).resample(time="Y").sum().mean(axis=0).values
+            year_sum = stats.year_sum.sel(year=slice(*map(int, period)))
+            burn_mask = (year_sum > 0).any(axis=0).values
+            burn_mean = year_sum.mean(axis=0).values
 
             for value, name in LANDCOVER_MAP.items():
                 landcover_mask = (landcover_arr == value)
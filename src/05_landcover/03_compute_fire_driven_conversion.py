@@ -5,9 +5,9 @@ import os
 
 import numpy as np
 import pandas as pd
-import xarray as xr
 from osgeo import gdal
 
+from src.utils.burn_cube import BurnCubeStats
 from src.utils.constants import REGIONS, LANDCOVER_PERIODS, LANDCOVER_MAP, AREA_FACTOR
 
 
@@ -24,13 +24,13 @@ if __name__ == "__main__":
         )
 
         burn_fn = f"data/nc/MODIS/MCD64A1/{region_name}/MCD64A1_500m.nc"
-        burn_da = xr.open_dataset(burn_fn, mask_and_scale=False)["Burn_Date"]
+        stats = BurnCubeStats.from_cube(burn_fn)
 
         landcover_folder = f"data/tif/landcover/{region_name}"
 
         for period in LANDCOVER_PERIODS:
 
-            burn_mask = (burn_da.sel(time=slice(*period)) > 0).any(axis=0).values
+            burn_mask = stats.period_mask(*period).values
 
             current_fn = os.path.join(landcover_folder, f"landcover_{period[1]}.tif")
             ds_current = gdal.Open(current_fn)
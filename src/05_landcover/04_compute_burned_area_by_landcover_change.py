@@ -36,7 +36,9 @@ if __name__ == "__main__":
         region_name = region.get("name")
         region_mask = gpd.read_file(region.get("path"))
 
-        grid = create_grid(*region_mask.bounds.loc[0], GRID_RESOLUTION, region_mask.crs)
+        grid = create_grid(
+            *region_mask.bounds.loc[0], GRID_RESOLUTION, region_mask.crs, mask=region_mask
+        )
         grid = gpd.clip(grid, region_mask)
         grid = grid[grid.area >= GRID_AREA_THRESHOLD * GRID_RESOLUTION ** 2]
 
@@ -33,7 +33,9 @@ if __name__ == "__main__":
 
         df = pd.DataFrame(columns=["year", "burned_area", "cwd"])
 
-        grid = create_grid(*region_mask.bounds.loc[0], GRID_RESOLUTION, region_mask.crs)
+        grid = create_grid(
+            *region_mask.bounds.loc[0], GRID_RESOLUTION, region_mask.crs, mask=region_mask
+        )
         grid = gpd.clip(grid, region_mask)
         grid = grid[grid.area >= GRID_AREA_THRESHOLD * GRID_RESOLUTION ** 2]
         grid = grid.reset_index()
@@ -6,12 +6,12 @@
 import os
 
 import numpy as np
-import rasterio
 import rioxarray
 import xarray
 from osgeo import gdal
 
 from src.utils.constants import REGIONS, ACCESSIBILITY_FEATURES, NODATA_VALUE
+from src.utils.functions import blocks_to_raster, get_block_windows
 
 if __name__ == "__main__":
 
@@ -63,26 +63,32 @@ if __name__ == "__main__":
                 cutlineDSName=region.get("path"),
             )
             dst_fn = os.path.join(output_folder, f"{feature.get('name')}_proximity.tif")
-            temp3 = gdal.Warp(dst_fn, temp2, options=warp_options)
-            stack.append(temp3.ReadAsArray())
+            stack.append(gdal.Warp(dst_fn, temp2, options=warp_options))
 
-        stack = np.stack(stack)
-        stack = np.ma.array(stack, mask=(stack == NODATA_VALUE))
-        arr = stack.min(axis=0)
-        arr = arr.filled(NODATA_VALUE)
+        # Combine the proximity rasters by keeping the minimum distance
+        # of each pixel. Rasters are read and combined in blocks of rows
+        # so the combined raster never has to be entirely in memory. The
+        # combined raster is written as a Cloud-Optimized GeoTIFF.
+        cols = stack[0].RasterXSize
+        rows = stack[0].RasterYSize
+        windows = get_block_windows(cols, rows, cols, 256)
+
+        def combine(window):
+            arrs = np.stack([temp.ReadAsArray(*window) for temp in stack])
+            arrs = np.ma.array(arrs, mask=(arrs == NODATA_VALUE))
+            return window, arrs.min(axis=0).filled(NODATA_VALUE)
 
         combined_fn = os.path.join(output_folder, "comb_proximity.tif")
-        with rasterio.open(
+        blocks_to_raster(
+            map(combine, windows),
             combined_fn,
-            "w",
-            driver="GTiff",
-            width=match_ds.rio.width,
-            height=match_ds.rio.height,
-            count=1,
-            crs=match_ds.rio.crs.to_wkt(),
-            transform=match_ds.rio.transform(),
-            dtype=rasterio.int16,
-            nodata=NODATA_VALUE,
-            compress="LZW"
-        ) as dst:
-            dst.write(arr, 1)
+            cols,
+            rows,
+            stack[0].GetProjection(),
+            stack[0].GetGeoTransform(),
+            gdal.GDT_Int16,
+            nd_val=NODATA_VALUE,
+            options=["COMPRESS=LZW"],
+            cog=True,
+        )
+        stack = None
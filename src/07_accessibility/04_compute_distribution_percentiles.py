@@ -7,9 +7,9 @@ import os
 
 import numpy as np
 import pandas as pd
-import xarray as xr
 from osgeo import gdal
 
+from src.utils.burn_cube import BurnCubeStats
 from src.utils.constants import (
     REGIONS,
     ACCESSIBILITY_FEATURES,
@@ -32,10 +32,7 @@ if __name__ == "__main__":
         )
 
         fn = f"data/nc/MODIS/MCD64A1/{region.get('name')}/MCD64A1_500m.nc"
-        da = xr.open_dataset(fn, mask_and_scale=False)["Burn_Date"]
-
-        burn_mask = (da > 0).any(axis=0)
-        burn_sum = (da > 0).sum(axis=0).values
+        burn_sum = BurnCubeStats.from_cube(fn).burn_sum.values
 
         feature_names = [item.get("name") for item in ACCESSIBILITY_FEATURES]
         feature_names.append("comb")
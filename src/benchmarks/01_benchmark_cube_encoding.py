@@ -0,0 +1,143 @@
+# -----------------------------------------------------------------------
+# Author: Marcelo Villa-Piñeros
+#
+# Purpose: Measures the read performance of the regional MCD64A1 data
+# cubes written with different layouts (contiguous NetCDF4, chunked and
+# compressed NetCDF4 and Zarr) for the access patterns used by the
+# exploration, landcover, fuel and accessibility stages.
+#
+# Notes: The access patterns are:
+#   * month_map:   reading the map of a single month (e.g. outlier
+#                  inspection and seasonal maps).
+#   * pixel_series: reading the full time series of individual pixels
+#                   (e.g. per-pixel trends and return intervals).
+#   * chunk_scan:  reading the whole cube a year at a time (e.g. the
+#                  computation of the burn statistics).
+# -----------------------------------------------------------------------
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from src.utils.constants import REGIONS, TIME_CHUNK_SIZE
+from src.utils.functions import write_cubes
+
+
+def get_size(path: str) -> int:
+    """
+    Computes the size of a file or a directory (e.g. a Zarr store).
+
+    Parameters
+    ----------
+    path: path to the file or directory.
+
+    Returns
+    -------
+    Size in bytes.
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    size = 0
+    for root, dirs, files in os.walk(path):
+        size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+
+    return size
+
+
+def time_access(da: xr.DataArray, pattern: str, n: int = 50) -> float:
+    """
+    Measures the time it takes to read a DataArray using a specific
+    access pattern.
+
+    Parameters
+    ----------
+    da:      3D DataArray with (time, y, x) dimensions.
+    pattern: access pattern. Either 'month_map', 'pixel_series' or
+             'chunk_scan'.
+    n:       number of months or pixels to read.
+
+    Returns
+    -------
+    Elapsed time in seconds.
+    """
+    ntime, rows, cols = da.shape
+    rng = np.random.default_rng(0)
+
+    start = time.perf_counter()
+    if pattern == "month_map":
+        for t in rng.integers(0, ntime, n):
+            da[t].values
+    elif pattern == "pixel_series":
+        for i, j in zip(rng.integers(0, rows, n), rng.integers(0, cols, n)):
+            da[:, i, j].values
+    elif pattern == "chunk_scan":
+        for t in range(0, ntime, TIME_CHUNK_SIZE):
+            (da[t : t + TIME_CHUNK_SIZE].values > 0).sum(axis=0)
+    else:
+        raise ValueError(f"Unknown access pattern: {pattern}")
+
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+
+    # Project's root
+    os.chdir("../..")
+
+    output_folder = "results/xlsx/benchmarks"
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    temp_folder = "data/temp/benchmarks"
+    if not os.path.exists(temp_folder):
+        os.makedirs(temp_folder)
+
+    layouts = ["contiguous", "netcdf", "zarr"]
+    patterns = ["month_map", "pixel_series", "chunk_scan"]
+
+    records = []
+    for region in REGIONS:
+
+        region_name = region.get("name")
+
+        fn = f"data/nc/MODIS/MCD64A1/{region_name}/MCD64A1_500m.nc"
+        with xr.open_dataset(fn, mask_and_scale=False) as ds:
+            ds = ds.load()
+
+        paths = {
+            "contiguous": os.path.join(temp_folder, f"{region_name}_contiguous.nc"),
+            "netcdf": os.path.join(temp_folder, f"{region_name}_chunked.nc"),
+            "zarr": os.path.join(temp_folder, f"{region_name}.zarr"),
+        }
+
+        # Write the same cube with each of the layouts.
+        contiguous = ds.copy()
+        for da in contiguous.data_vars.values():
+            da.encoding = {"dtype": da.encoding.get("dtype", da.dtype)}
+        contiguous.to_netcdf(paths["contiguous"])
+        write_cubes([ds.copy()], [paths["netcdf"]], "netcdf", "lon", "lat")
+        write_cubes([ds.copy()], [paths["zarr"]], "zarr", "lon", "lat")
+
+        for layout in layouts:
+            path = paths[layout]
+            if layout == "zarr":
+                cube = xr.open_zarr(path, mask_and_scale=False)
+            else:
+                cube = xr.open_dataset(path, mask_and_scale=False)
+
+            record = {"region": region_name, "layout": layout, "size": get_size(path)}
+            for pattern in patterns:
+                record[pattern] = time_access(cube["Burn_Date"], pattern)
+            records.append(record)
+
+            cube.close()
+
+    shutil.rmtree(temp_folder)
+
+    df = pd.DataFrame(records)
+    df.to_excel(os.path.join(output_folder, "cube_encoding.xlsx"), index=False)
+    print(df.to_string(index=False))
@@ -0,0 +1,72 @@
+# -----------------------------------------------------------------------
+# Author: Marcelo Villa-Piñeros
+#
+# Purpose: Compares the running time of the majority filter used to
+# remove the salt-and-pepper noise of the burn scars classifications
+# (binary_majority) with skimage's generic rank majority filter.
+#
+# Notes: The class maps are random burned/unburned arrays with the size
+# of a Landsat 8 scene tile and a full scene. Both filters must give the
+# same result.
+# -----------------------------------------------------------------------
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from skimage.filters.rank import majority
+from skimage.morphology import square
+
+from src.utils.constants import FILTER_NEIGHBOURS, RANDOM_SEED
+from src.utils.functions import binary_majority
+
+SHAPES = [(1024, 1024), (4096, 4096), (7800, 7700)]
+SIZES = [3, FILTER_NEIGHBOURS, 21]
+
+if __name__ == "__main__":
+
+    # Project's root
+    os.chdir("../..")
+
+    output_folder = "results/xlsx/benchmarks"
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    rng = np.random.default_rng(RANDOM_SEED)
+
+    records = []
+    for shape in SHAPES:
+
+        # Random class map with clustered burned pixels.
+        arr = (rng.random(shape) < 0.3).astype(np.uint8)
+        arr = majority(arr[: shape[0] // 4, : shape[1] // 4], square(3))
+        arr = np.kron(arr, np.ones((4, 4), dtype=np.uint8))
+        arr = arr ^ (rng.random(arr.shape) < 0.05)
+
+        for size in SIZES:
+
+            start = time.perf_counter()
+            expected = majority(arr, square(size))
+            skimage_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            result = binary_majority(arr, size)
+            binary_time = time.perf_counter() - start
+
+            if not np.array_equal(result, expected):
+                raise AssertionError(f"Results differ for {shape} and size {size}")
+
+            records.append(
+                {
+                    "rows": arr.shape[0],
+                    "cols": arr.shape[1],
+                    "size": size,
+                    "skimage": skimage_time,
+                    "binary_majority": binary_time,
+                    "speedup": skimage_time / binary_time,
+                }
+            )
+
+    df = pd.DataFrame(records)
+    df.to_excel(os.path.join(output_folder, "majority_filter.xlsx"), index=False)
+    print(df.to_string(index=False))
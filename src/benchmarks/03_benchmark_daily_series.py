@@ -0,0 +1,108 @@
+# -----------------------------------------------------------------------
+# Author: Marcelo Villa-Piñeros
+#
+# Purpose: Compares the running time of the daily burned pixels series
+# computed from the absolute burn dates (BurnDayCube.daily_series) with
+# the previous year by year implementation, which parsed day of the
+# year strings into dates.
+#
+# Notes: The previous implementation assigns the burn dates of monthly
+# composites that belong to the adjacent year (e.g. late December dates
+# in a January composite) to the composite's year, so both series may
+# differ on a few days. The number of days that differ is reported.
+# -----------------------------------------------------------------------
+import os
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from src.utils.burn_cube import BurnDayCube
+from src.utils.constants import REGIONS
+
+
+def legacy_daily_series(fn: str) -> pd.Series:
+    """
+    Builds the daily series of burned pixels year by year, parsing the
+    day of the year of each burn date.
+
+    Parameters
+    ----------
+    fn: path to the MCD64A1 NetCDF4 file.
+
+    Returns
+    -------
+    Series with the number of burned pixels for each day.
+    """
+    window_ds = xr.open_dataset(fn, mask_and_scale=False)
+
+    start = window_ds.time.dt.year.values.min()
+    end = window_ds.time.dt.year.values.max()
+    date_range = pd.date_range(str(start), str(end + 1), freq="D", inclusive="left")
+    daily_series = pd.Series(None, index=date_range, dtype=float)
+    daily_series.index.name = "time"
+
+    for year in window_ds.groupby("time.year").groups.keys():
+        year_window_ds = window_ds.sel(time=str(year))
+        days = year_window_ds["Burn_Date"].values
+        unique_days, counts = np.unique(days[days > 0], return_counts=True)
+        date_stings = np.char.add(unique_days.astype("str"), f"-{year}")
+        counts = pd.Series(counts, pd.to_datetime(date_stings, format="%j-%Y"))
+        daily_series.loc[counts.index] = counts
+
+    return daily_series.fillna(0)
+
+
+if __name__ == "__main__":
+
+    # Project's root
+    os.chdir("../..")
+
+    output_folder = "results/xlsx/benchmarks"
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    records = []
+    for region in REGIONS:
+
+        region_name = region.get("name")
+        region_mask = gpd.read_file(region.get("path"))
+        fn = f"data/nc/MODIS/MCD64A1/{region_name}/MCD64A1_500m.nc"
+
+        start = time.perf_counter()
+        legacy = legacy_daily_series(fn)
+        legacy_time = time.perf_counter() - start
+
+        # Conversion to absolute burn dates is only done once for each
+        # data cube and then read from the cache.
+        start = time.perf_counter()
+        cube = BurnDayCube.from_cube(fn, overwrite=True)
+        compute_time = time.perf_counter() - start
+
+        cube = BurnDayCube.from_cube(fn)
+        start = time.perf_counter()
+        series = cube.daily_series()
+        series_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        mask = cube.region_mask(region_mask.to_crs("epsg:4326").geometry)
+        cube.daily_series(mask)
+        masked_time = time.perf_counter() - start
+
+        records.append(
+            {
+                "region": region_name,
+                "legacy": legacy_time,
+                "days_cube": compute_time,
+                "daily_series": series_time,
+                "masked_daily_series": masked_time,
+                "speedup": legacy_time / series_time,
+                "different_days": int((legacy != series).sum()),
+            }
+        )
+
+    df = pd.DataFrame(records)
+    df.to_excel(os.path.join(output_folder, "daily_series.xlsx"), index=False)
+    print(df.to_string(index=False))
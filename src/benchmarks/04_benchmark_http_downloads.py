@@ -0,0 +1,238 @@
+# -----------------------------------------------------------------------
+# Author: Marcelo Villa-Piñeros
+#
+# Purpose: Measures the throughput of the concurrent HTTP downloads
+# (download_http_files) against a local server (serve_directory) for
+# different numbers of workers, and checks the recovery paths of
+# download_http_file: transfers interrupted partway that are resumed
+# with Range requests, partial files left by a previous execution,
+# corrupt partial files, files that are already complete and partial
+# files of files whose size is unknown.
+#
+# Notes: The files are random bytes written to a temporary folder that
+# is removed at the end. Every check raises an AssertionError if the
+# downloaded files are not identical to the served ones.
+# -----------------------------------------------------------------------
+import hashlib
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from src.utils.functions import download_http_file, download_http_files
+from src.utils.servers import serve_directory
+
+NUM_FILES = 16
+FILE_SIZE = 8 * 1024 ** 2
+WORKERS = [1, 2, 4, 8]
+
+
+def md5(fn: str) -> str:
+    """
+    Computes the hexadecimal MD5 digest of a file.
+
+    Parameters
+    ----------
+    fn: path to the file.
+
+    Returns
+    -------
+    Hexadecimal digest of the file.
+    """
+    h = hashlib.md5()
+    with open(fn, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def check_files(folder: str, checksums: dict) -> None:
+    """
+    Checks that a folder has the expected files without partial files.
+
+    Parameters
+    ----------
+    folder:    path to the folder with the downloaded files.
+    checksums: dictionary with filename:checksum pairs.
+    """
+    if sorted(os.listdir(folder)) != sorted(checksums):
+        raise AssertionError(f"Unexpected files in {folder}")
+    for fn, checksum in checksums.items():
+        if md5(os.path.join(folder, fn)) != checksum:
+            raise AssertionError(f"Downloaded file {fn} differs from the source")
+
+
+if __name__ == "__main__":
+
+    # Project's root
+    os.chdir("../..")
+
+    output_folder = "results/xlsx/benchmarks"
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    temp_folder = "data/temp/benchmarks/http"
+    source_folder = os.path.join(temp_folder, "source")
+    os.makedirs(source_folder, exist_ok=True)
+
+    checksums = {}
+    for i in range(NUM_FILES):
+        fn = f"file_{i:02d}.bin"
+        with open(os.path.join(source_folder, fn), "wb") as file:
+            file.write(os.urandom(FILE_SIZE))
+        checksums[fn] = md5(os.path.join(source_folder, fn))
+
+    total_size = NUM_FILES * FILE_SIZE / 1024 ** 2
+    records = []
+
+    # ---------- Concurrent downloads ----------
+    server, base_url = serve_directory(source_folder)
+    urls = [f"{base_url}/{fn}" for fn in checksums]
+    for max_workers in WORKERS:
+
+        save_to = os.path.join(temp_folder, f"workers_{max_workers}")
+        os.makedirs(save_to)
+        server.reset_stats()
+
+        start = time.perf_counter()
+        download_http_files(urls, save_to, max_workers)
+        elapsed = time.perf_counter() - start
+
+        check_files(save_to, checksums)
+        records.append(
+            {
+                "scenario": "download",
+                "max_workers": max_workers,
+                "seconds": elapsed,
+                "MB/s": total_size / elapsed,
+                "requests": sum(server.requests.values()),
+            }
+        )
+
+    # Files that are already complete are not downloaded again.
+    save_to = os.path.join(temp_folder, f"workers_{WORKERS[-1]}")
+    mtimes = {fn: os.path.getmtime(os.path.join(save_to, fn)) for fn in checksums}
+    server.reset_stats()
+
+    start = time.perf_counter()
+    download_http_files(urls, save_to, WORKERS[-1])
+    elapsed = time.perf_counter() - start
+
+    for fn, mtime in mtimes.items():
+        if os.path.getmtime(os.path.join(save_to, fn)) != mtime:
+            raise AssertionError(f"Complete file {fn} was downloaded again")
+    if sum(server.requests.values()) != NUM_FILES:
+        raise AssertionError("Complete files were requested more than once")
+    records.append(
+        {
+            "scenario": "skip complete",
+            "max_workers": WORKERS[-1],
+            "seconds": elapsed,
+            "MB/s": total_size / elapsed,
+            "requests": sum(server.requests.values()),
+        }
+    )
+
+    # Partial file left by a previous execution is resumed.
+    fn = next(iter(checksums))
+    save_to = os.path.join(temp_folder, "previous")
+    os.makedirs(save_to)
+    with open(os.path.join(source_folder, fn), "rb") as src:
+        with open(os.path.join(save_to, f"{fn}.part"), "wb") as dst:
+            dst.write(src.read(FILE_SIZE // 2))
+    server.reset_stats()
+
+    start = time.perf_counter()
+    download_http_file(urls[0], save_to, checksum=checksums[fn])
+    elapsed = time.perf_counter() - start
+
+    check_files(save_to, {fn: checksums[fn]})
+    records.append(
+        {
+            "scenario": "resume partial",
+            "max_workers": 1,
+            "seconds": elapsed,
+            "MB/s": FILE_SIZE / 2 / 1024 ** 2 / elapsed,
+            "requests": sum(server.requests.values()),
+        }
+    )
+
+    # Corrupt partial files are detected and removed.
+    save_to = os.path.join(temp_folder, "corrupt")
+    os.makedirs(save_to)
+    with open(os.path.join(save_to, f"{fn}.part"), "wb") as dst:
+        dst.write(os.urandom(FILE_SIZE // 2))
+    try:
+        download_http_file(urls[0], save_to, checksum=checksums[fn])
+    except Exception as err:
+        if "incomplete or corrupt" not in str(err):
+            raise
+    else:
+        raise AssertionError("Corrupt partial file was not detected")
+    if os.listdir(save_to):
+        raise AssertionError("Corrupt partial file was not removed")
+
+    server.shutdown()
+
+    # ---------- Interrupted downloads ----------
+    # Every transfer from the start of a file is cut after a third of
+    # the file and must be resumed with a Range request.
+    server, base_url = serve_directory(source_folder, drop_after=FILE_SIZE // 3)
+    urls = [f"{base_url}/{fn}" for fn in checksums]
+    for max_workers in WORKERS:
+
+        save_to = os.path.join(temp_folder, f"interrupted_{max_workers}")
+        os.makedirs(save_to)
+        server.reset_stats()
+
+        start = time.perf_counter()
+        download_http_files(urls, save_to, max_workers)
+        elapsed = time.perf_counter() - start
+
+        check_files(save_to, checksums)
+        if sum(server.requests.values()) < 3 * NUM_FILES:
+            raise AssertionError("Interrupted downloads were not resumed")
+        records.append(
+            {
+                "scenario": "interrupted",
+                "max_workers": max_workers,
+                "seconds": elapsed,
+                "MB/s": total_size / elapsed,
+                "requests": sum(server.requests.values()),
+            }
+        )
+
+    server.shutdown()
+
+    # ---------- Unknown size ----------
+    # Truncated partial files cannot be told apart from complete ones if
+    # the size of the file is unknown, so they must be downloaded again.
+    server, base_url = serve_directory(source_folder, unknown_size=True)
+    save_to = os.path.join(temp_folder, "unknown_size")
+    os.makedirs(save_to)
+    with open(os.path.join(source_folder, fn), "rb") as src:
+        with open(os.path.join(save_to, f"{fn}.part"), "wb") as dst:
+            dst.write(src.read(1234))
+
+    start = time.perf_counter()
+    download_http_file(f"{base_url}/{fn}", save_to)
+    elapsed = time.perf_counter() - start
+
+    check_files(save_to, {fn: checksums[fn]})
+    records.append(
+        {
+            "scenario": "unknown size",
+            "max_workers": 1,
+            "seconds": elapsed,
+            "MB/s": FILE_SIZE / 1024 ** 2 / elapsed,
+            "requests": sum(server.requests.values()),
+        }
+    )
+
+    server.shutdown()
+    shutil.rmtree(temp_folder)
+
+    df = pd.DataFrame(records)
+    df.to_excel(os.path.join(output_folder, "http_downloads.xlsx"), index=False)
+    print(df.to_string(index=False))
@@ -0,0 +1,113 @@
+# -----------------------------------------------------------------------
+# Author: Marcelo Villa-Piñeros
+#
+# Purpose: Measures the throughput of AppEEARSClient.download_tasks
+# against a mock AppEEARS API (start_mock_appeears_server) for different
+# numbers of concurrent files, with and without a flaky and slow
+# service. Each task is answered as 'processing' a few times before it
+# is done, so the tasks are polled while other tasks are downloaded.
+#
+# Notes: The mock answers every n-th request with a 503 status code,
+# which the client's session retries. The number of retried requests is
+# reported along with the throughput. The files of the tasks are random
+# bytes and every downloaded file must be identical to the served one.
+# -----------------------------------------------------------------------
+import hashlib
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from src.utils.appeears import AppEEARSClient
+from src.utils.functions import get_http_session
+from src.utils.servers import start_mock_appeears_server
+
+NUM_TASKS = 8
+FILES_PER_TASK = 4
+FILE_SIZE = 4 * 1024 ** 2
+POLLS = 2
+MAX_FILES = [1, 4, 8]
+
+# (fail_every, delay) pairs of the mock service.
+SERVICES = [(0, 0), (5, 0), (0, 0.05), (5, 0.05)]
+
+
+if __name__ == "__main__":
+
+    # Project's root
+    os.chdir("../..")
+
+    output_folder = "results/xlsx/benchmarks"
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    temp_folder = "data/temp/benchmarks/appeears"
+
+    files = {
+        f"task_{i}": {
+            f"file_{j}.nc": os.urandom(FILE_SIZE) for j in range(FILES_PER_TASK)
+        }
+        for i in range(NUM_TASKS)
+    }
+    total_size = NUM_TASKS * FILES_PER_TASK * FILE_SIZE / 1024 ** 2
+
+    records = []
+    for fail_every, delay in SERVICES:
+        for max_files in MAX_FILES:
+
+            # The number of polls of each task is consumed by the server,
+            # so the tasks are defined again for each run.
+            tasks = {
+                task_id: {"polls": POLLS, "files": task_files}
+                for task_id, task_files in files.items()
+            }
+            server, api_url = start_mock_appeears_server(tasks, fail_every, delay)
+            session = get_http_session(pool_size=max_files + NUM_TASKS)
+
+            save_to = os.path.join(temp_folder, f"run_{len(records)}")
+            task_folders = [
+                (task_id, os.path.join(save_to, task_id)) for task_id in tasks
+            ]
+
+            start = time.perf_counter()
+            with AppEEARSClient("user", "password", api_url, session) as client:
+                errors = [
+                    (task_id, error)
+                    for task_id, error in client.download_tasks(
+                        task_folders, max_files, delay=0.1, max_delay=1, timeout=60
+                    )
+                    if error is not None
+                ]
+            elapsed = time.perf_counter() - start
+            server.shutdown()
+
+            if errors:
+                raise AssertionError(f"Tasks failed: {errors}")
+            for task_id, folder in task_folders:
+                for fn, content in files[task_id].items():
+                    with open(os.path.join(folder, fn), "rb") as file:
+                        digest = hashlib.sha256(file.read()).hexdigest()
+                    if digest != hashlib.sha256(content).hexdigest():
+                        raise AssertionError(f"Downloaded file {fn} differs")
+
+            handler = server.RequestHandlerClass
+            records.append(
+                {
+                    "fail_every": fail_every,
+                    "delay": delay,
+                    "max_files": max_files,
+                    "seconds": elapsed,
+                    "MB/s": total_size / elapsed,
+                    "requests": handler.requests,
+                    "retries": handler.failures,
+                }
+            )
+
+            shutil.rmtree(save_to)
+
+    shutil.rmtree(temp_folder)
+
+    df = pd.DataFrame(records)
+    df.to_excel(os.path.join(output_folder, "appeears_downloads.xlsx"), index=False)
+    print(df.to_string(index=False))
@@ -0,0 +1,129 @@
+# -----------------------------------------------------------------------
+# Author: Marcelo Villa-Piñeros
+#
+# Purpose: Measures the running time of landsat.download_scenes against
+# a local copy of the Landsat 8 collection (write_mock_landsat_scenes
+# served with serve_directory) for different numbers of concurrent
+# files. Each number of files is run three times: without cached TIF
+# URLs (every index page is fetched), with the TIF URLs cached in the
+# JSON file by the first run (no index page is fetched) and again on the
+# complete downloads (every band is skipped).
+#
+# Notes: max_files is shared by all the scenes, so the maximum number of
+# requests handled by the server at the same time is reported for each
+# run; it should not exceed max_files once the TIF URLs are cached.
+# Every downloaded band must be identical to the served one.
+# -----------------------------------------------------------------------
+import filecmp
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from src.utils.constants import L8_BANDS
+from src.utils.landsat import download_scenes
+from src.utils.servers import serve_directory, write_mock_landsat_scenes
+
+PRS = ["004056", "004057", "005056", "005057"]
+DATES = ["20190115", "20190131", "20190216", "20190304", "20190320", "20190405"]
+FILE_SIZE = 4 * 1024 ** 2
+MAX_FILES = [1, 4, 8]
+MAX_PAGES = 8
+
+
+if __name__ == "__main__":
+
+    # Project's root
+    os.chdir("../..")
+
+    output_folder = "results/xlsx/benchmarks"
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    temp_folder = "data/temp/benchmarks/landsat"
+    source_folder = os.path.join(temp_folder, "source")
+
+    product_ids = [
+        f"LC08_L1TP_{pr}_{date}_{date}_01_T1" for pr in PRS for date in DATES
+    ]
+    index_paths = write_mock_landsat_scenes(source_folder, product_ids, FILE_SIZE)
+    total_size = len(product_ids) * len(L8_BANDS) * FILE_SIZE / 1024 ** 2
+
+    server, base_url = serve_directory(source_folder)
+
+    records = []
+    for max_files in MAX_FILES:
+
+        cache_fn = os.path.join(temp_folder, f"urls_{max_files}.json")
+        for run in ["cold", "cached urls", "complete"]:
+
+            # Complete downloads are run on the folder of the previous run.
+            if run != "complete":
+                save_to = os.path.join(temp_folder, f"{max_files}_{run}")
+            scenes = [
+                (f"{base_url}/{path}", os.path.join(save_to, product_id))
+                for path, product_id in zip(index_paths, product_ids)
+            ]
+            mtimes = {}
+            if run == "complete":
+                for _, folder in scenes:
+                    for fn in os.listdir(folder):
+                        fn = os.path.join(folder, fn)
+                        mtimes[fn] = os.path.getmtime(fn)
+            server.reset_stats()
+
+            start = time.perf_counter()
+            errors = [
+                (index_url, error)
+                for index_url, error in download_scenes(
+                    scenes, L8_BANDS, max_files, MAX_PAGES, cache_fn
+                )
+                if error is not None
+            ]
+            elapsed = time.perf_counter() - start
+
+            if errors:
+                raise AssertionError(f"Scenes failed: {errors}")
+
+            pages = sum(
+                count
+                for path, count in server.requests.items()
+                if path.endswith("index.html")
+            )
+            if pages != (len(product_ids) if run == "cold" else 0):
+                raise AssertionError(f"Unexpected index page requests in {run} run")
+
+            for path, (_, folder) in zip(index_paths, scenes):
+                expected = [f"{os.path.basename(folder)}_{b}.TIF" for b in L8_BANDS]
+                if sorted(os.listdir(folder)) != sorted(expected):
+                    raise AssertionError(f"Unexpected files in {folder}")
+                source = os.path.join(source_folder, os.path.dirname(path))
+                _, mismatch, errs = filecmp.cmpfiles(
+                    source, folder, expected, shallow=False
+                )
+                if mismatch or errs:
+                    raise AssertionError(f"Downloaded bands differ: {mismatch + errs}")
+
+            for fn, mtime in mtimes.items():
+                if os.path.getmtime(fn) != mtime:
+                    raise AssertionError(f"Complete band {fn} was downloaded again")
+
+            records.append(
+                {
+                    "run": run,
+                    "max_files": max_files,
+                    "seconds": elapsed,
+                    "MB/s": total_size / elapsed,
+                    "index_pages": pages,
+                    "requests": sum(server.requests.values()),
+                    "max_concurrent": server.max_active,
+                }
+            )
+
+    server.shutdown()
+    shutil.rmtree(temp_folder)
+
+    df = pd.DataFrame(records)
+    df.to_excel(os.path.join(output_folder, "landsat_downloads.xlsx"), index=False)
+    print(df.to_string(index=False))
@@ -0,0 +1,212 @@
+# -----------------------------------------------------------------------
+# Author: Marcelo Villa-Piñeros
+#
+# Purpose: Contains a client for the AppEEARS API that reuses a single
+# authenticated session to check the status of several tasks and
+# download their files concurrently.
+#
+# Notes: For more information about the AppEEARS API go to:
+# https://lpdaacsvc.cr.usgs.gov/appeears/api/
+# -----------------------------------------------------------------------
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List, Tuple
+
+import requests
+
+from src.utils.constants import APPEEARS_API_URL
+from src.utils.functions import download_http_file, get_http_session
+
+
+class TaskNotReadyException(Exception):
+    pass
+
+
+class AppEEARSClient:
+    """
+    Client for the AppEEARS API.
+
+    The client logs in once and uses the same token and session (and
+    therefore the same pool of connections) for every request. It can be
+    used as a context manager to automatically log out when done:
+
+        with AppEEARSClient(username, password) as client:
+            status = client.get_status(task_id)
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        api_url: str = APPEEARS_API_URL,
+        session: requests.Session = None
+    ):
+        self.username = username
+        self.password = password
+        self.api_url = api_url
+        self.session = session or get_http_session()
+        self.token = None
+
+    def __enter__(self) -> "AppEEARSClient":
+        self.login()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.logout()
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def login(self) -> None:
+        """
+        Gets an authorization token for the following requests.
+        """
+        r = self.session.post(
+            f"{self.api_url}/login", auth=(self.username, self.password)
+        )
+        r.raise_for_status()
+        self.token = r.json()["token"]
+
+    def logout(self) -> None:
+        """
+        Disposes of the authorization token.
+        """
+        if self.token:
+            self.session.post(f"{self.api_url}/logout", headers=self.headers)
+            self.token = None
+
+    def get_status(self, task_id: str) -> str:
+        """
+        Gets the status of a task (e.g. 'queued', 'processing' or 'done').
+        """
+        r = self.session.get(f"{self.api_url}/status/{task_id}", headers=self.headers)
+        r.raise_for_status()
+        return r.json().get("status")
+
+    def get_bundle(self, task_id: str, skip_files: bool = False) -> List[dict]:
+        """
+        Gets the description of the files of a finished task.
+
+        Parameters
+        ----------
+        task_id:    task ID
+        skip_files: whether to skip non-data files
+
+        Returns
+        -------
+        List of file descriptions (i.e. dictionaries with a 'file_id' key
+        among others).
+        """
+        r = self.session.get(f"{self.api_url}/bundle/{task_id}", headers=self.headers)
+        r.raise_for_status()
+        files = r.json()["files"]
+        if skip_files:
+            files = [file for file in files if file["file_type"] == "nc"]
+
+        return files
+
+    def wait_for_task(
+        self,
+        task_id: str,
+        delay: float = 5,
+        max_delay: float = 300,
+        timeout: float = None
+    ) -> None:
+        """
+        Polls the status of a task until it is done, waiting longer after
+        each unsuccessful attempt (exponential backoff).
+
+        Parameters
+        ----------
+        task_id:   task ID
+        delay:     seconds to wait after the first unsuccessful attempt.
+        max_delay: maximum number of seconds to wait between attempts.
+        timeout:   maximum number of seconds to wait for the task. If
+                   nothing is passed, only one attempt is made.
+
+        Returns
+        -------
+        None
+        """
+        start = time.monotonic()
+        while self.get_status(task_id) != "done":
+            elapsed = time.monotonic() - start
+            if timeout is None or elapsed + delay > timeout:
+                raise TaskNotReadyException(f"Task {task_id} is not ready.")
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+    def download_file(self, task_id: str, file: dict, save_to: str) -> str:
+        """
+        Downloads a single file of a finished task.
+
+        Parameters
+        ----------
+        task_id: task ID
+        file:    file description as returned by get_bundle.
+        save_to: folder to save the file to.
+
+        Returns
+        -------
+        Relative path of the saved file.
+        """
+        url = f"{self.api_url}/bundle/{task_id}/{file['file_id']}"
+        return download_http_file(
+            url,
+            save_to,
+            self.session,
+            headers=self.headers,
+            expected_size=file.get("file_size"),
+            checksum=file.get("sha256"),
+            hash_name="sha256",
+        )
+
+    def download_tasks(
+        self,
+        tasks: List[Tuple[str, str]],
+        max_files: int = 4,
+        skip_files: bool = False,
+        **kwargs
+    ) -> Iterator[Tuple[str, Exception]]:
+        """
+        Waits for several tasks concurrently and downloads the files of
+        each task as soon as it is done.
+
+        Parameters
+        ----------
+        tasks:      list of (task_id, save_to) pairs where save_to is the
+                    folder to save the files of the task to.
+        max_files:  maximum number of files downloaded at the same time
+                    across all tasks.
+        skip_files: whether to skip non-data files.
+        kwargs:     extra keyword arguments passed to wait_for_task.
+
+        Returns
+        -------
+        Generator of (task_id, error) pairs in the order in which tasks
+        finish. error is None if all the files of the task were
+        downloaded and the raised exception otherwise (e.g.
+        TaskNotReadyException).
+        """
+        with ThreadPoolExecutor(max_workers=max(len(tasks), 1)) as pollers, \
+                ThreadPoolExecutor(max_workers=max_files) as downloaders:
+
+            def process_task(task_id: str, save_to: str) -> None:
+                self.wait_for_task(task_id, **kwargs)
+                files = self.get_bundle(task_id, skip_files)
+                os.makedirs(save_to, exist_ok=True)
+                futures = [
+                    downloaders.submit(self.download_file, task_id, file, save_to)
+                    for file in files
+                ]
+                for future in futures:
+                    future.result()
+
+            futures = {
+                pollers.submit(process_task, task_id, save_to): task_id
+                for task_id, save_to in tasks
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.exception()
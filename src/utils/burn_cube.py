@@ -0,0 +1,1040 @@
+# -----------------------------------------------------------------------
+# Author: Marcelo Villa-Piñeros
+#
+# Purpose: Computes, caches and serves the burn statistics derived from
+# the regional MCD64A1 data cubes that are used by several stages of the
+# project (e.g. monthly and daily series, per-pixel burn counts,
+# per-year burn counts and last burn dates) and the burn dates of each
+# pixel as absolute dates.
+#
+# Notes: The statistics are computed in a single pass over the time
+# dimension of the data cube, reading a fixed number of months at a
+# time. The result is cached next to the data cube so subsequent stages
+# do not need to read the whole cube again. The statistics are running
+# sums, so when a new MCD64A1 release appends months to the data cube
+# only those months are read and folded into the cached statistics.
+#
+# The Burn_Date variable of MCD64A1 holds the day of the year in which
+# a pixel burned. A monthly composite may include a few days of the
+# adjacent months, so the burn date of a January composite may belong
+# to the previous year and the one of a December composite to the next
+# year. Converting the burn dates to days since a fixed epoch once
+# makes any date range query a single integer comparison.
+# -----------------------------------------------------------------------
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+import rioxarray
+import xarray as xr
+from rasterio.features import geometry_mask
+
+from src.utils.constants import NODATA_VALUE
+from src.utils.functions import get_block_windows, set_cube_encoding
+
+# Burn dates cube used by each worker process (see _init_worker).
+_worker = {}
+
+
+class BurnCubeStats:
+    """
+    Burn statistics of a MCD64A1 data cube.
+
+    Attributes
+    ----------
+    ds: Dataset with the following variables:
+        * monthly:    number of burned pixels for each month (time).
+        * burn_sum:   number of months each pixel burned (lat, lon).
+        * year_sum:   number of months each pixel burned in each year
+                      (year, lat, lon).
+        * daily:      number of burned pixels for each day (day),
+                      including the days of the adjacent years that
+                      appear in the monthly composites.
+        * last_burn:  last burn date of each pixel as days since
+                      BurnDayCube.EPOCH (lat, lon). Pixels that never
+                      burned are 0.
+    """
+
+    def __init__(self, ds: xr.Dataset):
+        self.ds = ds
+
+    @classmethod
+    def compute(
+        cls, fn: str, chunk_size: int = 12, var: str = "Burn_Date"
+    ) -> "BurnCubeStats":
+        """
+        Computes the burn statistics of a MCD64A1 data cube reading it in
+        chunks along the time dimension.
+
+        Parameters
+        ----------
+        fn:         path to the MCD64A1 NetCDF4 file.
+        chunk_size: number of months to read at a time.
+        var:        name of the variable with the burn dates.
+
+        Returns
+        -------
+        BurnCubeStats object.
+        """
+        with _open_burn_dates(fn, var) as da:
+            y_dim, x_dim = da.dims[1:]
+            rows, cols = da.shape[1:]
+
+            ds = xr.Dataset(
+                {
+                    "monthly": (("time",), np.zeros(0, dtype=np.int64)),
+                    "burn_sum": (
+                        (y_dim, x_dim), np.zeros((rows, cols), dtype=np.uint16)
+                    ),
+                    "year_sum": (
+                        ("year", y_dim, x_dim),
+                        np.zeros((0, rows, cols), dtype=np.uint8),
+                    ),
+                    "daily": (("day",), np.zeros(0, dtype=np.int64)),
+                    "last_burn": (
+                        (y_dim, x_dim), np.zeros((rows, cols), dtype=np.int16)
+                    ),
+                },
+                coords={
+                    "time": da["time"].values[:0],
+                    "year": np.zeros(0, dtype=np.int64),
+                    "day": pd.DatetimeIndex([]),
+                    y_dim: da[y_dim].values,
+                    x_dim: da[x_dim].values,
+                },
+            )
+            ds = ds.rio.set_spatial_dims(x_dim=x_dim, y_dim=y_dim)
+            ds = ds.rio.write_crs(da.rio.crs or "epsg:4326")
+            ds = ds.rio.write_transform(da.rio.transform())
+
+            stats = cls(ds)
+            stats._fold(da, chunk_size)
+        stats._set_source(fn)
+
+        return stats
+
+    def update(
+        self, fn: str, chunk_size: int = 12, var: str = "Burn_Date"
+    ) -> None:
+        """
+        Folds the months appended to a MCD64A1 data cube since the
+        statistics were computed into the statistics. Only the new
+        months are read.
+
+        Parameters
+        ----------
+        fn:         path to the MCD64A1 NetCDF4 file.
+        chunk_size: number of months to read at a time.
+        var:        name of the variable with the burn dates.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError: if the data cube's grid is different or its first
+                    months are not the months the statistics were
+                    computed from (i.e. the data cube changed in a way
+                    other than new months being appended).
+        """
+        with _open_burn_dates(fn, var) as da:
+            y_dim, x_dim = da.dims[1:]
+
+            n = self.ds["time"].size
+            same_grid = (
+                np.array_equal(da[y_dim].values, self.ds[y_dim].values)
+                and np.array_equal(da[x_dim].values, self.ds[x_dim].values)
+            )
+            same_months = n <= da["time"].size and np.array_equal(
+                da["time"].values[:n], self.ds["time"].values
+            )
+            if not (same_grid and same_months):
+                raise ValueError(f"{fn} is not an extension of the cached statistics.")
+
+            self._fold(da[n:], chunk_size)
+        self._set_source(fn)
+
+    def _fold(self, da: xr.DataArray, chunk_size: int) -> None:
+        """
+        Adds the burned pixels of a sequence of months to the statistics.
+
+        Parameters
+        ----------
+        da:         3D DataArray (time, lat, lon) with the burn dates of
+                    the months to add. They must come after the months
+                    already in the statistics.
+        chunk_size: number of months to read at a time.
+
+        Returns
+        -------
+        None
+        """
+        ds = self.ds
+        y_dim, x_dim = ds["burn_sum"].dims
+        time = da["time"]
+        if time.size == 0:
+            return
+
+        # Extend the years and the days covered by the statistics. Days
+        # span from the year before the first year to the year after
+        # the last one so burn dates of the adjacent years are kept.
+        years = np.union1d(ds["year"].values, np.unique(time.dt.year.values))
+        year_sum = np.zeros((years.size,) + ds["burn_sum"].shape, dtype=np.uint8)
+        year_sum[np.searchsorted(years, ds["year"].values)] = ds["year_sum"].values
+        year_idx = np.searchsorted(years, time.dt.year.values)
+
+        days = pd.date_range(
+            str(years[0] - 1), str(years[-1] + 2), freq="D", inclusive="left"
+        )
+        daily = ds["daily"].to_pandas().reindex(days, fill_value=0).values.copy()
+        offset = BurnDayCube.to_days(days[0])
+
+        monthly = np.zeros(time.size, dtype=np.int64)
+        burn_sum = ds["burn_sum"].values.copy()
+        last_burn = ds["last_burn"].values.copy()
+
+        for start in range(0, time.size, chunk_size):
+            stop = min(start + chunk_size, time.size)
+            doy = da[start:stop].values
+
+            # Any pixel with a Burn Date value greater than zero is, by
+            # definition, a pixel that burned on a given month.
+            burned = doy > 0
+            monthly[start:stop] = burned.sum(axis=(1, 2))
+            burn_sum += burned.sum(axis=0, dtype=np.uint16)
+
+            for i in range(stop - start):
+                year_sum[year_idx[start + i]] += burned[i]
+
+                month_days = BurnDayCube.convert(doy[i], time.values[start + i])
+                np.maximum(last_burn, month_days, out=last_burn)
+                month_days = month_days[burned[i]].astype(np.int64) - offset
+                daily += np.bincount(month_days, minlength=days.size)
+
+        state = xr.Dataset(
+            {
+                "monthly": (
+                    ("time",), np.concatenate([ds["monthly"].values, monthly])
+                ),
+                "burn_sum": ((y_dim, x_dim), burn_sum),
+                "year_sum": (("year", y_dim, x_dim), year_sum),
+                "daily": (("day",), daily),
+                "last_burn": ((y_dim, x_dim), last_burn),
+            },
+            coords={
+                "time": np.concatenate([ds["time"].values, time.values]),
+                "year": years,
+                "day": days,
+                y_dim: ds[y_dim].values,
+                x_dim: ds[x_dim].values,
+            },
+            attrs=ds.attrs,
+        )
+        state = state.rio.set_spatial_dims(x_dim=x_dim, y_dim=y_dim)
+        state = state.rio.write_crs(ds.rio.crs)
+        state = state.rio.write_transform(ds.rio.transform())
+
+        self.ds = state
+
+    def _set_source(self, fn: str) -> None:
+        # Keep track of the source file to know when the cache is stale.
+        self.ds.attrs["source"] = os.path.abspath(fn)
+        self.ds.attrs["source_mtime"] = os.path.getmtime(fn)
+
+    @classmethod
+    def load(cls, fn: str) -> "BurnCubeStats":
+        """
+        Loads previously cached burn statistics.
+
+        Parameters
+        ----------
+        fn: path to the cached statistics NetCDF4 file.
+
+        Returns
+        -------
+        BurnCubeStats object.
+        """
+        with xr.open_dataset(fn, mask_and_scale=False, decode_coords="all") as ds:
+            ds = ds.load()
+
+        y_dim, x_dim = ds["burn_sum"].dims
+        ds = ds.rio.set_spatial_dims(x_dim=x_dim, y_dim=y_dim)
+
+        return cls(ds)
+
+    @classmethod
+    def from_cube(
+        cls, fn: str, chunk_size: int = 12, overwrite: bool = False
+    ) -> "BurnCubeStats":
+        """
+        Gets the burn statistics of a MCD64A1 data cube, loading them
+        from the cache if it exists and is up to date, updating the cache
+        if new months were appended to the data cube or computing and
+        caching them otherwise.
+
+        Parameters
+        ----------
+        fn:         path to the MCD64A1 NetCDF4 file.
+        chunk_size: number of months to read at a time.
+        overwrite:  whether to recompute the statistics even if a valid
+                    cache exists.
+
+        Returns
+        -------
+        BurnCubeStats object.
+        """
+        cache_fn = get_stats_filename(fn)
+        if os.path.exists(cache_fn) and not overwrite:
+            stats = cls.load(cache_fn)
+            if stats.ds.attrs.get("source_mtime") == os.path.getmtime(fn):
+                return stats
+
+            # A new release of the data cube only adds months at the end,
+            # so only those months need to be read. Caches written before
+            # the daily series was part of the statistics are recomputed.
+            if "daily" in stats.ds:
+                try:
+                    stats.update(fn, chunk_size)
+                    stats.save(cache_fn)
+                    return stats
+                except ValueError:
+                    pass
+
+        stats = cls.compute(fn, chunk_size)
+        stats.save(cache_fn)
+
+        return stats
+
+    def save(self, fn: str) -> None:
+        """
+        Writes the burn statistics to a NetCDF4 file.
+
+        Parameters
+        ----------
+        fn: output NetCDF4 file name.
+
+        Returns
+        -------
+        None
+        """
+        self.ds.to_netcdf(fn)
+
+    @property
+    def years(self) -> np.ndarray:
+        return self.ds["year"].values
+
+    @property
+    def burn_sum(self) -> xr.DataArray:
+        return self.ds["burn_sum"]
+
+    @property
+    def burn_mask(self) -> xr.DataArray:
+        return self.ds["burn_sum"] > 0
+
+    @property
+    def year_sum(self) -> xr.DataArray:
+        return self.ds["year_sum"]
+
+    @property
+    def monthly_series(self) -> pd.Series:
+        return self.ds["monthly"].to_pandas()
+
+    @property
+    def daily_series(self) -> pd.Series:
+        years = self.years
+        series = self.ds["daily"].sel(day=slice(str(years[0]), str(years[-1])))
+        series = series.to_pandas()
+        series.index.name = "time"
+        return series
+
+    @property
+    def last_burn(self) -> xr.DataArray:
+        return self.ds["last_burn"]
+
+    def period_sum(self, start: str, end: str) -> xr.DataArray:
+        """
+        Computes the number of months each pixel burned in a period.
+
+        Parameters
+        ----------
+        start: first year of the period (inclusive).
+        end:   last year of the period (inclusive).
+
+        Returns
+        -------
+        2D DataArray with the number of burned months.
+        """
+        year_sum = self.ds["year_sum"].sel(year=slice(int(start), int(end)))
+        return year_sum.sum(axis=0, dtype=np.uint16)
+
+    def period_mask(self, start: str, end: str) -> xr.DataArray:
+        """
+        Computes a mask of the pixels that burned at least once in a
+        period.
+
+        Parameters
+        ----------
+        start: first year of the period (inclusive).
+        end:   last year of the period (inclusive).
+
+        Returns
+        -------
+        2D boolean DataArray.
+        """
+        return self.period_sum(start, end) > 0
+
+
+class BurnDayCube:
+    """
+    Burn dates of a MCD64A1 data cube as days since an epoch.
+
+    Attributes
+    ----------
+    da: 3D DataArray (time, lat, lon) with the number of days between
+        EPOCH and the burn date of each pixel. Unburned pixels are 0 and
+        the negative values of the original data (i.e. unmapped and
+        water pixels) are kept.
+    """
+
+    EPOCH = pd.Timestamp("2000-01-01")
+
+    def __init__(self, da: xr.DataArray):
+        self.da = da
+
+    @classmethod
+    def compute(
+        cls, fn: str, chunk_size: int = 12, var: str = "Burn_Date"
+    ) -> "BurnDayCube":
+        """
+        Computes the burn dates as days since EPOCH from a MCD64A1 data
+        cube reading it in chunks along the time dimension.
+
+        Parameters
+        ----------
+        fn:         path to the MCD64A1 NetCDF4 file.
+        chunk_size: number of months to read at a time.
+        var:        name of the variable with the burn dates.
+
+        Returns
+        -------
+        BurnDayCube object.
+        """
+        with _open_burn_dates(fn, var) as da:
+            y_dim, x_dim = da.dims[1:]
+
+            days = np.zeros(da.shape, dtype=np.int16)
+            for start in range(0, da["time"].size, chunk_size):
+                stop = min(start + chunk_size, da["time"].size)
+                doy = da[start:stop].values
+
+                for i in range(stop - start):
+                    days[start + i] = cls.convert(doy[i], da["time"].values[start + i])
+
+            days = xr.DataArray(
+                days,
+                dims=("time", y_dim, x_dim),
+                coords={"time": da["time"].values, y_dim: da[y_dim], x_dim: da[x_dim]},
+                name="Burn_Days",
+                attrs={"epoch": str(cls.EPOCH.date())},
+            )
+            days = days.rio.set_spatial_dims(x_dim=x_dim, y_dim=y_dim)
+            days = days.rio.write_crs(da.rio.crs or "epsg:4326")
+            days = days.rio.write_transform(da.rio.transform())
+
+        # Keep track of the source file to know when the cache is stale.
+        days.attrs["source"] = os.path.abspath(fn)
+        days.attrs["source_mtime"] = os.path.getmtime(fn)
+
+        return cls(days)
+
+    @classmethod
+    def convert(cls, doy: np.ndarray, month) -> np.ndarray:
+        """
+        Converts the burn dates of a monthly composite to days since
+        EPOCH.
+
+        Parameters
+        ----------
+        doy:   2D array with the burn dates of the composite as the day
+               of the year.
+        month: date of the composite (e.g. '2018-01-01').
+
+        Returns
+        -------
+        2D int16 array with days since EPOCH. Unburned pixels are 0 and
+        negative values are kept.
+        """
+        month = pd.Timestamp(month)
+        year_start = pd.Timestamp(year=month.year, month=1, day=1)
+        offset = (year_start - cls.EPOCH).days
+        mid_month = (month + pd.Timedelta(14, unit="D") - cls.EPOCH).days
+        year_length = 366 if year_start.is_leap_year else 365
+        prev_length = 366 if (year_start - pd.DateOffset(years=1)).is_leap_year else 365
+
+        burned = doy > 0
+        month_days = offset + doy[burned].astype(np.int32) - 1
+
+        # Burn dates more than half a year away from the middle of the
+        # month belong to the previous or next year.
+        month_days = np.where(
+            month_days - mid_month > 183, month_days - prev_length, month_days
+        )
+        month_days = np.where(
+            mid_month - month_days > 183, month_days + year_length, month_days
+        )
+
+        days = np.where(doy < 0, doy, 0).astype(np.int16)
+        days[burned] = month_days
+
+        return days
+
+    @classmethod
+    def load(cls, fn: str) -> "BurnDayCube":
+        """
+        Opens previously cached burn dates. Data is read lazily.
+
+        Parameters
+        ----------
+        fn: path to the cached burn dates NetCDF4 file.
+
+        Returns
+        -------
+        BurnDayCube object.
+        """
+        ds = xr.open_dataset(fn, mask_and_scale=False, decode_coords="all")
+        da = ds["Burn_Days"]
+        da.attrs.update(ds.attrs)
+
+        y_dim, x_dim = da.dims[1:]
+        da = da.rio.set_spatial_dims(x_dim=x_dim, y_dim=y_dim)
+
+        return cls(da)
+
+    @classmethod
+    def from_cube(
+        cls, fn: str, chunk_size: int = 12, overwrite: bool = False
+    ) -> "BurnDayCube":
+        """
+        Gets the burn dates of a MCD64A1 data cube, loading them from the
+        cache if it exists and is up to date or computing and caching
+        them otherwise.
+
+        Parameters
+        ----------
+        fn:         path to the MCD64A1 NetCDF4 file.
+        chunk_size: number of months to read at a time.
+        overwrite:  whether to recompute the burn dates even if a valid
+                    cache exists.
+
+        Returns
+        -------
+        BurnDayCube object.
+        """
+        cache_fn = get_days_filename(fn)
+        if os.path.exists(cache_fn) and not overwrite:
+            cube = cls.load(cache_fn)
+            if cube.da.attrs.get("source_mtime") == os.path.getmtime(fn):
+                return cube
+            cube.da.close()
+
+        cube = cls.compute(fn, chunk_size)
+        cube.save(cache_fn)
+
+        return cube
+
+    def save(self, fn: str) -> None:
+        """
+        Writes the burn dates to a chunked and compressed NetCDF4 file.
+
+        Parameters
+        ----------
+        fn: output NetCDF4 file name.
+
+        Returns
+        -------
+        None
+        """
+        y_dim, x_dim = self.da.dims[1:]
+        ds = self.da.to_dataset()
+        ds.attrs.update(self.da.attrs)
+        ds = set_cube_encoding(ds, x_dim=x_dim, y_dim=y_dim)
+        ds.to_netcdf(fn)
+
+    @classmethod
+    def to_days(cls, date) -> int:
+        """
+        Converts a date to the number of days since EPOCH.
+
+        Parameters
+        ----------
+        date: date (e.g. '2018-01-31' or a Timestamp).
+
+        Returns
+        -------
+        Number of days.
+        """
+        return (pd.Timestamp(date).normalize() - cls.EPOCH).days
+
+    def between(self, start, end) -> xr.DataArray:
+        """
+        Selects the months of the data cube that may hold burn dates
+        within a date range.
+
+        Parameters
+        ----------
+        start: first date of the range (inclusive).
+        end:   last date of the range (inclusive).
+
+        Returns
+        -------
+        3D DataArray with days since EPOCH.
+        """
+        # Monthly composites may include a few days of the adjacent
+        # months.
+        first_month = (pd.Timestamp(start).to_period("M") - 1).to_timestamp()
+        last_month = (pd.Timestamp(end).to_period("M") + 1).to_timestamp()
+
+        return self.da.sel(time=slice(first_month, last_month))
+
+    def burned_between(self, start, end) -> xr.DataArray:
+        """
+        Computes a mask of the pixels that burned within a date range.
+
+        Parameters
+        ----------
+        start: first date of the range (inclusive).
+        end:   last date of the range (inclusive).
+
+        Returns
+        -------
+        2D boolean DataArray.
+        """
+        days = self.between(start, end)
+        burned = (days >= self.to_days(start)) & (days <= self.to_days(end))
+
+        return burned.any(axis=0)
+
+    def daily_series(
+        self, mask: np.ndarray = None, chunk_size: int = 12
+    ) -> pd.Series:
+        """
+        Builds the daily series of burned pixels for the whole range of
+        years in the data cube.
+
+        Parameters
+        ----------
+        mask:       optional 2D boolean array with the pixels to take into
+                    account (e.g. the output of region_mask).
+        chunk_size: number of months to read at a time.
+
+        Returns
+        -------
+        Series with the number of burned pixels for each day.
+
+        Notes
+        -----
+        Burn dates are offsets from the first day of the series, so the
+        number of pixels that burned on each day is counted with a
+        single bincount for each chunk of months.
+        """
+        years = self.da["time"].dt.year.values
+        start = pd.Timestamp(str(years.min()))
+        end = pd.Timestamp(str(years.max() + 1))
+        dates = pd.date_range(start, end, freq="D", inclusive="left")
+        offset = self.to_days(start)
+
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+
+        counts = np.zeros(dates.size, dtype=np.int64)
+        for i in range(0, self.da["time"].size, chunk_size):
+            days = self.da[i:i + chunk_size].values
+            if mask is not None:
+                days = days[:, mask]
+            days = days[days > 0].astype(np.int64) - offset
+
+            # Burn dates outside the range of years belong to months that
+            # are not in the data cube.
+            days = days[(days >= 0) & (days < dates.size)]
+            counts += np.bincount(days, minlength=dates.size)
+
+        series = pd.Series(counts, index=dates)
+        series.index.name = "time"
+
+        return series
+
+    def region_mask(
+        self, geometries: Iterable, all_touched: bool = False
+    ) -> np.ndarray:
+        """
+        Creates a mask of the pixels of the data cube inside a set of
+        polygons.
+
+        Parameters
+        ----------
+        geometries:  polygons in the data cube's coordinate reference
+                     system.
+        all_touched: whether to include all the pixels touched by the
+                     polygons or only those whose center is inside them.
+
+        Returns
+        -------
+        2D boolean array.
+        """
+        y_dim, x_dim = self.da.dims[1:]
+        return geometry_mask(
+            geometries,
+            out_shape=(self.da[y_dim].size, self.da[x_dim].size),
+            transform=self.da.rio.transform(recalc=True),
+            invert=True,
+            all_touched=all_touched,
+        )
+
+
+def return_interval_blocks(
+    fn: str,
+    block_size: int = 512,
+    time_chunk: int = 12,
+    var: str = "Burn_Date",
+    nd_val: float = NODATA_VALUE,
+    max_workers: int = None,
+    year_sum: np.ndarray = None
+) -> Iterator[Tuple[Tuple[int, int, int, int], np.ndarray]]:
+    """
+    Computes the fire return interval of each pixel of a MCD64A1 data
+    cube tile by tile. The return interval is computed following the
+    equation: RI = (n + 1) / m, where n + 1 corresponds to the number of
+    years on record (i.e. the number of distinct years in the data
+    cube, which is the last year minus the first year plus one when no
+    year is missing) and m corresponds to the number of months the
+    pixel burned.
+
+    Parameters
+    ----------
+    fn:          path to the MCD64A1 NetCDF4 file.
+    block_size:  number of rows and columns of each tile.
+    time_chunk:  number of months read at a time for each tile.
+    var:         name of the variable with the burn dates.
+    nd_val:      value of the pixels that never burned.
+    max_workers: number of parallel processes used to read the tiles.
+                 If None, the number of processors is used.
+    year_sum:    optional 3D array (year, lat, lon) with the number of
+                 months each pixel burned in each year (e.g. the cached
+                 BurnCubeStats.year_sum). If passed, the data cube is not
+                 read.
+
+    Returns
+    -------
+    Generator of (window, block) pairs (see functions.blocks_to_raster)
+    with 2D float32 blocks, in row-major order of the tiles.
+    """
+    for window, year_counts in _year_count_blocks(
+        fn, block_size, time_chunk, var, max_workers, year_sum
+    ):
+        burn_events = year_counts.sum(axis=0)
+        yield window, _return_interval(burn_events, len(year_counts), nd_val)
+
+
+def sliding_return_interval_blocks(
+    fn: str,
+    window_years: int,
+    block_size: int = 512,
+    time_chunk: int = 12,
+    var: str = "Burn_Date",
+    nd_val: float = NODATA_VALUE,
+    max_workers: int = None,
+    year_sum: np.ndarray = None
+) -> Iterator[Tuple[Tuple[int, int, int, int], np.ndarray]]:
+    """
+    Computes the fire return interval of each pixel of a MCD64A1 data
+    cube for sliding windows of years, tile by tile. Each window's
+    return interval is computed as RI = w / m, where w corresponds to
+    the window's number of years and m corresponds to the number of
+    months the pixel burned within the window.
+
+    Parameters
+    ----------
+    fn:           path to the MCD64A1 NetCDF4 file.
+    window_years: number of years of each window.
+    block_size:   number of rows and columns of each tile.
+    time_chunk:   number of months read at a time for each tile.
+    var:          name of the variable with the burn dates.
+    nd_val:       value of the pixels that did not burn within a
+                  window.
+    max_workers:  number of parallel processes used to read the tiles.
+                  If None, the number of processors is used.
+    year_sum:     optional 3D array (year, lat, lon) with the number of
+                  months each pixel burned in each year (e.g. the cached
+                  BurnCubeStats.year_sum). If passed, the data cube is
+                  not read.
+
+    Returns
+    -------
+    Generator of (window, block) pairs (see functions.blocks_to_raster)
+    with 3D float32 blocks that have a band for each window, in the
+    order given by get_sliding_years.
+    """
+    for window, year_counts in _year_count_blocks(
+        fn, block_size, time_chunk, var, max_workers, year_sum
+    ):
+        # Burn counts of every window from the cumulative sum of the
+        # yearly counts.
+        cumsum = np.zeros((len(year_counts) + 1,) + year_counts.shape[1:], np.uint32)
+        np.cumsum(year_counts, axis=0, out=cumsum[1:])
+        burn_events = cumsum[window_years:] - cumsum[:-window_years]
+
+        yield window, _return_interval(burn_events, window_years, nd_val)
+
+
+def get_burned_fraction(
+    fn: str, factor: int, chunk_size: int = 12, var: str = "Burn_Date"
+) -> xr.DataArray:
+    """
+    Computes the monthly fraction of burned pixels in the cells of a
+    coarser grid whose cells span factor x factor pixels of a MCD64A1
+    data cube, reading it in chunks along the time dimension.
+
+    Parameters
+    ----------
+    fn:         path to the MCD64A1 NetCDF4 file.
+    factor:     number of rows and columns of pixels of each cell.
+    chunk_size: number of months to read at a time.
+    var:        name of the variable with the burn dates.
+
+    Returns
+    -------
+    3D float32 DataArray (time, lat, lon) with the fraction of the
+    mapped pixels of each cell that burned in each month. Cells without
+    mapped pixels (e.g. outside the region) are NaN.
+
+    Notes
+    -----
+    Only pixels with a Burn Date value greater than or equal to zero
+    (i.e. burned or unburned pixels) are taken into account. Cells on
+    the right and bottom edges may span fewer pixels.
+    """
+    with _open_burn_dates(fn, var) as da:
+        y_dim, x_dim = da.dims[1:]
+        months, rows, cols = da.shape
+        out_rows = -(-rows // factor)
+        out_cols = -(-cols // factor)
+        pad = ((0, 0), (0, out_rows * factor - rows), (0, out_cols * factor - cols))
+
+        fraction = np.empty((months, out_rows, out_cols), dtype=np.float32)
+        for start in range(0, months, chunk_size):
+            stop = min(start + chunk_size, months)
+            dates = da[start:stop].values
+
+            shape = (stop - start, out_rows, factor, out_cols, factor)
+            burned = np.pad(dates > 0, pad).reshape(shape).sum(axis=(2, 4))
+            mapped = np.pad(dates >= 0, pad).reshape(shape).sum(axis=(2, 4))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                fraction[start:stop] = burned / mapped
+
+        # Coordinates of the cells' centers.
+        transform = da.rio.transform()
+        x = transform.c + (np.arange(out_cols) + 0.5) * factor * transform.a
+        y = transform.f + (np.arange(out_rows) + 0.5) * factor * transform.e
+
+        fraction = xr.DataArray(
+            fraction,
+            dims=("time", y_dim, x_dim),
+            coords={"time": da["time"].values, y_dim: y, x_dim: x},
+            name="fraction",
+        )
+        fraction = fraction.rio.set_spatial_dims(x_dim=x_dim, y_dim=y_dim)
+        fraction = fraction.rio.write_crs(da.rio.crs or "epsg:4326")
+
+    return fraction
+
+
+def get_sliding_years(fn: str, window_years: int) -> List[int]:
+    """
+    Gets the last year of each sliding window of years of a MCD64A1 data
+    cube.
+
+    Parameters
+    ----------
+    fn:           path to the MCD64A1 NetCDF4 file.
+    window_years: number of years of each window.
+
+    Returns
+    -------
+    List with the last year of each window.
+    """
+    with xr.open_dataset(fn) as ds:
+        years = np.unique(ds["time"].dt.year.values)
+
+    return years[window_years - 1:].tolist()
+
+
+def _return_interval(
+    burn_events: np.ndarray, nyears: int, nd_val: float
+) -> np.ndarray:
+    """
+    Divides the number of years by the number of burn events, filling
+    the pixels without burn events with nd_val.
+    """
+    return_interval = np.full(burn_events.shape, nd_val, dtype=np.float32)
+    burned = burn_events > 0
+    return_interval[burned] = nyears / burn_events[burned]
+
+    return return_interval
+
+
+def _year_count_blocks(
+    fn: str,
+    block_size: int,
+    time_chunk: int,
+    var: str,
+    max_workers: int,
+    year_sum: np.ndarray = None
+) -> Iterator[Tuple[Tuple[int, int, int, int], np.ndarray]]:
+    """
+    Counts the number of months each pixel of a MCD64A1 data cube burned
+    in each year, tile by tile and in parallel.
+
+    Parameters
+    ----------
+    fn:          path to the MCD64A1 NetCDF4 file.
+    block_size:  number of rows and columns of each tile.
+    time_chunk:  number of months read at a time for each tile.
+    var:         name of the variable with the burn dates.
+    max_workers: number of parallel processes used to read the tiles.
+    year_sum:    optional 3D array (year, lat, lon) with the counts of
+                 the whole data cube. If passed, tiles are cut from it
+                 instead of reading the data cube.
+
+    Returns
+    -------
+    Generator of (window, counts) pairs where counts is a 3D array
+    (year, rows, cols), in row-major order of the tiles.
+
+    Notes
+    -----
+    At most twice as many tiles as worker processes are submitted at a
+    time and a new tile is only submitted when the next tile in order is
+    yielded, so the number of tiles held in memory does not depend on
+    the size of the data cube.
+    """
+    if year_sum is not None:
+        rows, cols = year_sum.shape[1:]
+        for window in get_block_windows(cols, rows, block_size, block_size):
+            xoff, yoff, xsize, ysize = window
+            yield window, year_sum[:, yoff:yoff + ysize, xoff:xoff + xsize]
+        return
+
+    with xr.open_dataset(fn, mask_and_scale=False) as ds:
+        rows, cols = ds[var].shape[1:]
+
+    windows = get_block_windows(cols, rows, block_size, block_size)
+    max_workers = max_workers or os.cpu_count()
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(fn, var, time_chunk),
+    ) as executor:
+        pending = deque()
+        for window in windows:
+            pending.append((window, executor.submit(_count_tile, window)))
+            if len(pending) >= 2 * max_workers:
+                window, future = pending.popleft()
+                yield window, future.result()
+
+        while pending:
+            window, future = pending.popleft()
+            yield window, future.result()
+
+
+def _init_worker(fn: str, var: str, time_chunk: int) -> None:
+    """
+    Opens the burn dates of a MCD64A1 data cube once per worker process.
+    The data cube stays open for the life of the process.
+    """
+    _worker["stack"] = ExitStack()
+    da = _worker["stack"].enter_context(_open_burn_dates(fn, var))
+    _worker["da"] = da
+    _worker["time_chunk"] = time_chunk
+    _worker["years"] = np.unique(da["time"].dt.year.values)
+    _worker["year_idx"] = np.searchsorted(_worker["years"], da["time"].dt.year.values)
+
+
+def _count_tile(window: Tuple[int, int, int, int]) -> np.ndarray:
+    """
+    Counts the number of months each pixel of a tile burned in each
+    year, reading a fixed number of months at a time.
+    """
+    da = _worker["da"]
+    time_chunk = _worker["time_chunk"]
+    year_idx = _worker["year_idx"]
+
+    xoff, yoff, xsize, ysize = window
+    tile = da[:, yoff:yoff + ysize, xoff:xoff + xsize]
+
+    counts = np.zeros((_worker["years"].size, ysize, xsize), dtype=np.uint16)
+    for start in range(0, tile["time"].size, time_chunk):
+        stop = min(start + time_chunk, tile["time"].size)
+        burned = tile[start:stop].values > 0
+        for i in range(stop - start):
+            counts[year_idx[start + i]] += burned[i]
+
+    return counts
+
+
+@contextmanager
+def _open_burn_dates(fn: str, var: str = "Burn_Date") -> Iterator[xr.DataArray]:
+    """
+    Opens the burn dates of a MCD64A1 data cube lazily, closing the file
+    when the context is exited so the data cube can be rewritten.
+
+    Parameters
+    ----------
+    fn:  path to the MCD64A1 NetCDF4 file.
+    var: name of the variable with the burn dates.
+
+    Returns
+    -------
+    Context manager of a 3D DataArray (time, lat, lon) with its spatial
+    dimensions set.
+    """
+    with xr.open_dataset(fn, mask_and_scale=False) as ds:
+        da = ds[var]
+        y_dim, x_dim = da.dims[1:]
+        yield da.rio.set_spatial_dims(x_dim=x_dim, y_dim=y_dim)
+
+
+def get_days_filename(fn: str) -> str:
+    """
+    Builds the path of the cached burn dates of a data cube.
+
+    Parameters
+    ----------
+    fn: path to the MCD64A1 NetCDF4 file.
+
+    Returns
+    -------
+    Path to the cached burn dates NetCDF4 file.
+    """
+    root, ext = os.path.splitext(fn)
+    return f"{root}_days{ext}"
+
+
+def get_stats_filename(fn: str) -> str:
+    """
+    Builds the path of the cached burn statistics of a data cube.
+
+    Parameters
+    ----------
+    fn: path to the MCD64A1 NetCDF4 file.
+
+    Returns
+    -------
+    Path to the cached statistics NetCDF4 file.
+    """
+    root, ext = os.path.splitext(fn)
+    return f"{root}_stats{ext}"
@@ -15,6 +15,8 @@ EARTHDATA_PASSWORD = os.environ.get("EARTHDATA_PASSWORD")
 # going to be submitted and each key should correspond to a task name.
 SAVE_PATHS = {"MCD64A1": "data/nc/MODIS/MCD64A1"}
 
+APPEEARS_API_URL = "https://lpdaacsvc.cr.usgs.gov/appeears/api"
+
 REGIONS = [
     {"name": "orinoquia", "path": "data/shp/regions/orinoquia.shp"},
     {"name": "flooded", "path": "data/shp/regions/flooded.shp"},
@@ -29,6 +31,10 @@ AREA_FACTOR = (500 * 500) / 10000
 
 NODATA_VALUE = -9999
 
+# Number of time steps (i.e. months) of a data cube that are read and
+# processed at a time.
+TIME_CHUNK_SIZE = 12
+
 BURNED_AREA_THRESHOLD = 0.8
 
 # Download link for Landsat's World Reference System-2 descending
@@ -4,15 +4,29 @@
 # Purpose: Contains functions used by different scripts in the project.
 # -----------------------------------------------------------------------
 import cgi
+import hashlib
 import os
 import zipfile
-from typing import Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Tuple, Union
 
+import dask
 import geopandas as gpd
 import numpy as np
+import pyproj
 import requests
-from osgeo import gdal
-from shapely.geometry import Polygon
+import rioxarray
+import shapely
+import xarray as xr
+from osgeo import gdal, gdal_array
+from rasterio.features import geometry_mask, rasterize
+from requests.adapters import HTTPAdapter
+from scipy import ndimage
+from scipy.stats import norm
+from urllib3.util.retry import Retry
+
+# Cache of HTTP sessions returned by get_http_session.
+_HTTP_SESSIONS = {}
 
 
 def array_to_raster(
@@ -24,7 +38,7 @@ def array_to_raster(
     driver: str = "GTiff",
     nd_val: float = None,
     options: list = []
-) -> None:
+) -> gdal.Dataset:
     """
     Writes a 2D or 3D NumPy array to a raster file in disk.
 
@@ -41,7 +55,9 @@ def array_to_raster(
 
     Returns
     -------
-    None
+    GDAL dataset. Its cache is flushed before returning it, but it is
+    the caller's responsibility to close it (i.e. dereference it) when
+    it is no longer needed.
     """
     assert 2 <= len(arr.shape) <= 3, "arr must have either 2 or 3 dimensions"
 
@@ -71,72 +87,347 @@ def array_to_raster(
             band.WriteArray(arr[i])
         else:
             band.WriteArray(arr)
-        if nd_val:
+        if nd_val is not None:
             band.SetNoDataValue(nd_val)
         band.FlushCache()
 
+    out_ds.FlushCache()
+
     return out_ds
 
 
+def binary_majority(arr: np.ndarray, size: int) -> np.ndarray:
+    """
+    Applies a majority filter with a square window to a binary array.
+
+    Parameters
+    ----------
+    arr:  2D array whose only values are 0 and 1.
+    size: number of rows and columns of the square window.
+
+    Returns
+    -------
+    2D array with the most frequent value in the window of each pixel.
+
+    Notes
+    -----
+    The result is the same as skimage.filters.rank.majority with a
+    square(size) footprint: only the pixels inside the array are taken
+    into account at the edges and ties are resolved in favor of 0. The
+    number of ones in each window is computed from a summed-area table,
+    so the running time does not depend on the size of the window.
+    """
+    if arr.ndim != 2:
+        raise ValueError("arr must be a 2D array")
+    if arr.size and (arr.min() < 0 or arr.max() > 1):
+        raise ValueError("arr must only contain 0 and 1")
+
+    rows, cols = arr.shape
+    before = size // 2
+    after = size - 1 - before
+
+    # Summed-area table with a leading row and column of zeros.
+    sat = np.zeros((rows + 1, cols + 1), dtype=np.int32)
+    np.cumsum(arr, axis=0, dtype=np.int32, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+
+    # Window limits of each row and column, clipped to the array.
+    top = np.clip(np.arange(rows) - before, 0, rows)
+    bottom = np.clip(np.arange(rows) + after + 1, 0, rows)
+    left = np.clip(np.arange(cols) - before, 0, cols)
+    right = np.clip(np.arange(cols) + after + 1, 0, cols)
+
+    ones = (
+        sat[bottom[:, np.newaxis], right]
+        - sat[top[:, np.newaxis], right]
+        - sat[bottom[:, np.newaxis], left]
+        + sat[top[:, np.newaxis], left]
+    )
+    counts = (bottom - top)[:, np.newaxis] * (right - left)
+
+    return (2 * ones > counts).astype(arr.dtype)
+
+
+def blocks_to_raster(
+    blocks: Iterable[Tuple[Tuple[int, int, int, int], np.ndarray]],
+    fn: str,
+    cols: int,
+    rows: int,
+    sr: str,
+    gt: Union[list, tuple],
+    gdtype: int,
+    bands: int = 1,
+    driver: str = "GTiff",
+    nd_val: float = None,
+    options: list = [],
+    cog: bool = False,
+    resampling: str = "NEAREST",
+    descriptions: List[str] = None
+) -> None:
+    """
+    Writes a raster file in disk from a sequence of blocks, without ever
+    holding the whole raster in memory.
+
+    Parameters
+    ----------
+    blocks:       iterable (e.g. a generator) of (window, block) pairs
+                  where window is a (xoff, yoff, xsize, ysize) tuple and
+                  block is a 2D array (or a 3D array for multiple bands)
+                  with the values of that window.
+    fn:           output raster's file name.
+    cols:         output raster's number of columns.
+    rows:         output raster's number of rows.
+    sr:           output raster's spatial reference in a WKT string.
+    gt:           output raster's geotransform.
+    gdtype:       GDAL data type.
+    bands:        output raster's number of bands.
+    driver:       raster's driver name. Ignored if cog is True.
+    nd_val:       output raster's NoData value.
+    options:      GDAL creation options. If cog is True, these must be
+                  valid creation options for GDAL's COG driver.
+    cog:          whether to write a Cloud-Optimized GeoTIFF (i.e. an
+                  internally tiled GeoTIFF with overviews).
+    resampling:   resampling method used to compute the overviews when cog
+                  is True.
+    descriptions: optional description of each band (e.g. the year each
+                  band corresponds to).
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    GDAL's COG driver can only create files from an existing dataset.
+    Thus, when cog is True, blocks are first written to a temporary
+    tiled GeoTIFF file next to the output file, which is then converted
+    to a COG and removed.
+    """
+    if cog:
+        out_fn = f"{os.path.splitext(fn)[0]}_temp.tif"
+        driver = "GTiff"
+        create_options = ["TILED=YES", "BIGTIFF=IF_SAFER"]
+    else:
+        out_fn = fn
+        create_options = options
+
+    driver = gdal.GetDriverByName(driver)
+    if not driver:
+        raise Exception(
+            "Driver name is not valid. Check "
+            "https://gdal.org/drivers/raster/index.html for valid names."
+        )
+    out_ds = driver.Create(out_fn, cols, rows, bands, gdtype, create_options)
+    try:
+        out_ds.SetProjection(sr)
+        out_ds.SetGeoTransform(gt)
+        if nd_val is not None:
+            for i in range(bands):
+                out_ds.GetRasterBand(i + 1).SetNoDataValue(nd_val)
+        if descriptions is not None:
+            for i, description in enumerate(descriptions):
+                out_ds.GetRasterBand(i + 1).SetDescription(description)
+
+        for (xoff, yoff, _, _), block in blocks:
+            if block.ndim == 2:
+                block = block[np.newaxis]
+            for i in range(bands):
+                out_ds.GetRasterBand(i + 1).WriteArray(block[i], xoff, yoff)
+
+        out_ds.FlushCache()
+
+        if cog:
+            translate_options = gdal.TranslateOptions(
+                format="COG", creationOptions=options + [f"RESAMPLING={resampling}"]
+            )
+            cog_ds = gdal.Translate(fn, out_ds, options=translate_options)
+            cog_ds = None
+
+    finally:
+        # Dereferencing the datasets closes them and writes them to disk.
+        # The temporary file is removed even if writing fails.
+        out_ds = None
+        if cog and os.path.exists(out_fn):
+            os.remove(out_fn)
+
+
+def clip_regions(
+    ds: xr.Dataset,
+    regions: List[dict],
+    x_dim: str = "x",
+    y_dim: str = "y",
+    time_chunk: int = None,
+    all_touched: bool = False,
+    shared_window: bool = True
+) -> List[xr.Dataset]:
+    """
+    Clips a dataset using the polygons of several regions, reading the
+    source data only once.
+
+    Parameters
+    ----------
+    ds:            Dataset with spatial dimensions and a coordinate
+                   reference system (e.g. set with rioxarray's
+                   set_spatial_dims and write_crs methods).
+    regions:       list of dictionaries with a 'path' key pointing to
+                   each region's polygon file (e.g. REGIONS in
+                   constants.py).
+    x_dim:         name of the x (longitude) dimension.
+    y_dim:         name of the y (latitude) dimension.
+    time_chunk:    if passed, the data is processed lazily in chunks of
+                   this number of time steps using dask. Otherwise, the
+                   source data covering the regions is loaded into
+                   memory at once.
+    all_touched:   whether to include every pixel touched by the
+                   polygons or only the pixels whose center is within
+                   them.
+    shared_window: whether to read a single window covering all the
+                   regions (best for nested or neighbouring regions) or
+                   one window per region (best for regions that are far
+                   apart from each other).
+
+    Returns
+    -------
+    List with a clipped dataset for each region (in the same order as
+    regions). Pixels outside each region's polygons are set to the
+    variables' NoData value (or NaN if they do not have one).
+
+    Notes
+    -----
+    Only the window of the source data covering the bounding box of the
+    regions is read. The source dataset is subset to that window by
+    index (see get_index_window) before anything is read, so this works
+    lazily on global datasets. The polygons of each region are then
+    rasterized onto the window and each region's dataset is cut from it
+    by integer index slicing, which gives the same result as calling
+    rioxarray's clip method for each region. If time_chunk is passed,
+    the returned datasets are backed by dask and should be written all
+    at once (e.g. using xarray's save_mfdataset function) so each chunk
+    of the source data is only read once.
+    """
+    masks = [gpd.read_file(region["path"]).to_crs(ds.rio.crs) for region in regions]
+    bounds = np.array([mask.total_bounds for mask in masks])
+
+    if shared_window:
+        xmin, ymin = bounds[:, :2].min(axis=0)
+        xmax, ymax = bounds[:, 2:].max(axis=0)
+        groups = [((xmin, ymin, xmax, ymax), list(range(len(masks))))]
+    else:
+        groups = [(tuple(bounds[i]), [i]) for i in range(len(masks))]
+
+    datasets = [None] * len(masks)
+    for window_bounds, idx in groups:
+
+        window = get_index_window(ds, window_bounds, x_dim, y_dim)
+        window_ds = ds.isel(window)
+        if time_chunk:
+            window_ds = window_ds.chunk({"time": time_chunk})
+        else:
+            window_ds = window_ds.load()
+        window_ds = window_ds.rio.set_spatial_dims(x_dim=x_dim, y_dim=y_dim)
+
+        for i in idx:
+            datasets[i] = _clip_to_mask(
+                window_ds, masks[i], x_dim, y_dim, all_touched
+            ).rio.write_crs(ds.rio.crs)
+
+    return datasets
+
+
 def create_grid(
     xmin: float,
     ymin: float,
     xmax: float,
     ymax: float,
     resolution: float,
-    crs: str = "epsg:4326"
+    crs: str = "epsg:4326",
+    mask: gpd.GeoDataFrame = None
 ) -> gpd.GeoDataFrame:
     """
+    Creates a regular grid of square cells covering a bounding box.
 
     Parameters
     ----------
-    xmin
-    ymin
-    xmax
-    ymax
-    resolution
-    crs
+    xmin:       minimum x coordinate of the bounding box.
+    ymin:       minimum y coordinate of the bounding box.
+    xmax:       maximum x coordinate of the bounding box.
+    ymax:       maximum y coordinate of the bounding box.
+    resolution: side length of each cell.
+    crs:        grid's coordinate reference system.
+    mask:       optional GeoDataFrame. If passed, only the cells that
+                intersect any of its geometries are kept.
 
     Returns
     -------
+    GeoDataFrame with one polygon per cell.
 
+    Notes
+    -----
+    Cells are ordered column-wise (i.e. all cells of the first column
+    from top to bottom, then all cells of the second column and so on).
+    All the cells are created at once from the coordinate arrays rather
+    than one by one.
     """
-    height = np.ceil((ymax - ymin) / resolution).astype(np.int)
-    width = np.ceil((xmax - xmin) / resolution).astype(np.int)
+    height = int(np.ceil((ymax - ymin) / resolution))
+    width = int(np.ceil((xmax - xmin) / resolution))
     x_coords = xmin + np.arange(width) * resolution
     y_coords = ymax - np.arange(height) * resolution
 
-    geometries = []
-    for x in x_coords:
-        for y in y_coords:
-            geom = Polygon(
-                [
-                    (x, y),
-                    (x + resolution, y),
-                    (x + resolution, y + resolution),
-                    (x, y + resolution),
-                ]
-            )
-            geometries.append(geom)
+    xx, yy = np.meshgrid(x_coords, y_coords, indexing="ij")
+    xx = xx.ravel()
+    yy = yy.ravel()
+    geometries = shapely.box(xx, yy, xx + resolution, yy + resolution)
+    grid = gpd.GeoDataFrame(geometry=geometries, crs=crs)
 
-    return gpd.GeoDataFrame(geometry=geometries, crs=crs)
+    if mask is not None:
+        idx = grid.sindex.query(mask.geometry, predicate="intersects")[1]
+        grid = grid.iloc[np.unique(idx)]
 
+    return grid
 
-def download_http_file(url: str, save_to: str = None) -> str:
+
+def download_http_file(
+    url: str,
+    save_to: str = None,
+    session: requests.Session = None,
+    chunk_size: int = 1024 * 1024,
+    resume: bool = True,
+    expected_size: int = None,
+    checksum: str = None,
+    hash_name: str = "md5",
+    headers: dict = None,
+    retries: int = 3
+) -> str:
     """
     Downloads a file using the HTTP(S) protocol.
 
     Parameters
     ----------
-    url:     HTTP(S) URL with the downloadable file.
-    save_to: optional path to folder (e.g. /home/foo) or file
-             (e.g. /home/foo/bar.txt). If a path to a folder is passed,
-             the file is saved to that folder using the original filename
-             from the headers of the file or from the URL. If a path to
-             a file is passed, the file will be saved to that path using
-             the given filename, ignoring the original filename. If nothing
-             is passed, the file will be saved to the current working
-             directory with the original filename.
+    url:           HTTP(S) URL with the downloadable file.
+    save_to:       optional path to folder (e.g. /home/foo) or file
+                   (e.g. /home/foo/bar.txt). If a path to a folder is
+                   passed, the file is saved to that folder using the
+                   original filename from the headers of the file or from
+                   the URL. If a path to a file is passed, the file will be
+                   saved to that path using the given filename, ignoring
+                   the original filename. If nothing is passed, the file
+                   will be saved to the current working directory with the
+                   original filename.
+    session:       requests session to download the file with. If nothing
+                   is passed, the session returned by get_http_session is
+                   used.
+    chunk_size:    number of bytes to write to disk at a time.
+    resume:        whether to resume a previous partial download of the
+                   file using an HTTP Range request.
+    expected_size: expected file size in bytes. If nothing is passed, the
+                   Content-Length header is used (if available).
+    checksum:      expected hexadecimal digest of the file.
+    hash_name:     name of the hashlib algorithm used to compute the
+                   checksum.
+    headers:       extra HTTP headers to send with the request (e.g.
+                   authorization headers).
+    retries:       number of times to resume the download if the
+                   connection is interrupted while transferring data.
 
     Returns
     -------
@@ -144,11 +435,30 @@ def download_http_file(url: str, save_to: str = None) -> str:
 
     Notes
     -----
-    This function has been slightly adapted from:
+    This function has been adapted from:
     https://stackoverflow.com/a/53153505/7144368
+
+    Data is written to a temporary file with a '.part' suffix that is
+    renamed once the download is complete and verified. If a file with
+    the expected size (and checksum, if given) already exists in the
+    output path, it is not downloaded again.
+
+    The name and size of the file are taken from the response to a one
+    byte range request, so no data is transferred to skip or resume a
+    file. Partial files are only resumed if the size of the file is
+    known (from expected_size or from the headers); otherwise they are
+    removed and the file is downloaded from scratch.
     """
+    session = session or get_http_session()
+    headers = headers or {}
+
     try:
-        with requests.get(url, stream=True) as r:
+        # Probe the file with a one byte range request, so files that are
+        # already complete or partially downloaded are not transferred
+        # again. Servers that ignore ranges send the whole file, which is
+        # then written right away.
+        probe_headers = {**headers, "Range": "bytes=0-0"}
+        with session.get(url, stream=True, headers=probe_headers) as r:
 
             r.raise_for_status()
 
@@ -166,16 +476,455 @@ def download_http_file(url: str, save_to: str = None) -> str:
                 if os.path.isdir(save_to):
                     save_to = os.path.join(save_to, fn)
 
-            with open(save_to, "wb") as file:
-                for chunk in r.iter_content(chunk_size=1024):
-                    file.write(chunk)
+            # The one byte body is read so the connection can be reused.
+            accepts_ranges = r.status_code == 206
+            if accepts_ranges:
+                r.content
+            if expected_size is None:
+                expected_size = _get_content_size(r)
+
+            # Skip files that have already been downloaded.
+            if _is_complete(save_to, expected_size, checksum, hash_name):
+                return save_to
+
+            # Partial files can only be resumed if the size of the file is
+            # known. Otherwise, a truncated file could not be told apart
+            # from a complete one.
+            part_fn = f"{save_to}.part"
+            can_resume = resume and accepts_ranges and expected_size is not None
+            if not can_resume and os.path.exists(part_fn):
+                os.remove(part_fn)
+
+            if not accepts_ranges:
+                try:
+                    _write_response(r, part_fn, "wb", chunk_size)
+                except (
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.ConnectionError,
+                ):
+                    if expected_size is None:
+                        os.remove(part_fn)
+                        raise
 
-            return save_to
+        # Download the file from scratch if its size is unknown.
+        if expected_size is None and accepts_ranges:
+            try:
+                with session.get(url, stream=True, headers=headers) as r:
+                    r.raise_for_status()
+                    _write_response(r, part_fn, "wb", chunk_size)
+            except (
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.ConnectionError,
+            ):
+                if os.path.exists(part_fn):
+                    os.remove(part_fn)
+                raise
+
+        # Resume the download if the transfer was interrupted or if
+        # there was a partial file from a previous execution.
+        if expected_size is not None:
+            for _ in range(retries + 1):
+                offset = os.path.getsize(part_fn) if os.path.exists(part_fn) else 0
+                if offset >= expected_size:
+                    break
+                range_headers = {**headers, "Range": f"bytes={offset}-"}
+                try:
+                    with session.get(url, stream=True, headers=range_headers) as r:
+                        r.raise_for_status()
+                        mode = "ab" if r.status_code == 206 else "wb"
+                        _write_response(r, part_fn, mode, chunk_size)
+                except (
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.ConnectionError,
+                ):
+                    continue
+
+        if not _is_complete(part_fn, expected_size, checksum, hash_name):
+            if os.path.exists(part_fn):
+                os.remove(part_fn)
+            raise Exception(f"Downloaded file {save_to} is incomplete or corrupt.")
+        os.replace(part_fn, save_to)
+
+        return save_to
 
     except requests.exceptions.HTTPError as err:
         raise Exception(f"Error while downloading task. {err}")
 
 
+def download_http_files(
+    urls: Iterable[str],
+    save_to: Union[str, Iterable[str]] = None,
+    max_workers: int = 4,
+    session: requests.Session = None,
+    **kwargs
+) -> list:
+    """
+    Downloads multiple files concurrently using the HTTP(S) protocol.
+
+    Parameters
+    ----------
+    urls:        HTTP(S) URLs with the downloadable files.
+    save_to:     path to folder shared by all files or sequence of paths
+                 (one for each URL). See download_http_file.
+    max_workers: maximum number of files downloaded at the same time.
+    session:     requests session shared by all downloads. If nothing is
+                 passed, the session returned by get_http_session is used.
+    kwargs:      extra keyword arguments passed to download_http_file.
+
+    Returns
+    -------
+    List with the relative paths of the saved files in the same order as
+    urls.
+    """
+    urls = list(urls)
+    if save_to is None or isinstance(save_to, str):
+        save_to = [save_to] * len(urls)
+    session = session or get_http_session(pool_size=max_workers)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(download_http_file, url, path, session, **kwargs)
+            for url, path in zip(urls, save_to)
+        ]
+        return [future.result() for future in futures]
+
+
+def get_block_windows(
+    xsize: int, ysize: int, block_xsize: int, block_ysize: int
+) -> Iterator[Tuple[int, int, int, int]]:
+    """
+    Generates the windows that cover a raster block by block.
+
+    Parameters
+    ----------
+    xsize:       raster's number of columns.
+    ysize:       raster's number of rows.
+    block_xsize: block's number of columns.
+    block_ysize: block's number of rows.
+
+    Returns
+    -------
+    Generator of (xoff, yoff, win_xsize, win_ysize) tuples. Windows on
+    the right and bottom edges are trimmed to the raster's size.
+    """
+    for yoff in range(0, ysize, block_ysize):
+        win_ysize = min(block_ysize, ysize - yoff)
+        for xoff in range(0, xsize, block_xsize):
+            win_xsize = min(block_xsize, xsize - xoff)
+            yield xoff, yoff, win_xsize, win_ysize
+
+
+def get_fractional_coverage(
+    geometries: Iterable,
+    transform,
+    shape: Tuple[int, int],
+    factor: int = 10,
+    block_rows: int = 256
+) -> np.ndarray:
+    """
+    Computes the fraction of each pixel of a grid that is covered by a
+    set of geometries.
+
+    Parameters
+    ----------
+    geometries: polygons in the same coordinate reference system as the
+                grid.
+    transform:  grid's affine transform (e.g. rasterio's transform).
+    shape:      grid's number of rows and columns.
+    factor:     number of subpixels along each dimension of a pixel.
+    block_rows: number of rows of the grid processed at a time.
+
+    Returns
+    -------
+    2D array with the covered fraction (between 0 and 1) of each pixel.
+
+    Notes
+    -----
+    The geometries are rasterized on a grid aligned with the original
+    one whose pixels are split into factor x factor subpixels. The
+    covered fraction of a pixel is then the mean of its subpixels. The
+    approximation error is at most 1 / factor times the length of the
+    geometries' boundary inside the pixel (in pixel units).
+    """
+    geometries = list(geometries)
+    rows, cols = shape
+    coverage = np.zeros(shape, dtype=np.float64)
+    if not geometries:
+        return coverage
+
+    sub_transform = transform * transform.scale(1 / factor)
+    for row_off in range(0, rows, block_rows):
+        nrows = min(block_rows, rows - row_off)
+        block = rasterize(
+            geometries,
+            out_shape=(nrows * factor, cols * factor),
+            transform=sub_transform * transform.translation(0, row_off * factor),
+            dtype=np.uint8,
+        )
+        coverage[row_off:row_off + nrows] = block.reshape(
+            nrows, factor, cols, factor
+        ).mean(axis=(1, 3))
+
+    return coverage
+
+
+def get_http_session(pool_size: int = 10, retries: int = 5) -> requests.Session:
+    """
+    Gets a requests session with a connection pool and automatic retries.
+
+    Parameters
+    ----------
+    pool_size: maximum number of connections kept open per host.
+    retries:   number of times a request is retried on connection errors
+               and on 429, 500, 502, 503 and 504 HTTP status codes.
+
+    Returns
+    -------
+    requests session.
+
+    Notes
+    -----
+    Sessions are cached, so calling this function again with the same
+    arguments returns the same session and its open connections are
+    reused.
+    """
+    key = (pool_size, retries)
+    if key not in _HTTP_SESSIONS:
+        retry = Retry(
+            total=retries,
+            backoff_factor=1,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _HTTP_SESSIONS[key] = session
+
+    return _HTTP_SESSIONS[key]
+
+
+def get_index_window(
+    ds: Union[xr.Dataset, xr.DataArray],
+    bounds: Union[list, tuple],
+    x_dim: str = "x",
+    y_dim: str = "y"
+) -> dict:
+    """
+    Gets the index window of the pixels of a dataset that intersect a
+    bounding box.
+
+    Parameters
+    ----------
+    ds:     Dataset or DataArray with 1D x and y coordinates.
+    bounds: bounding box as (xmin, ymin, xmax, ymax) in the dataset's
+            coordinate reference system.
+    x_dim:  name of the x (longitude) dimension.
+    y_dim:  name of the y (latitude) dimension.
+
+    Returns
+    -------
+    Dictionary with dimension:slice pairs that can be passed to the
+    dataset's isel method.
+
+    Notes
+    -----
+    Only the coordinates are read to compute the window, and both
+    ascending and descending axes are supported. Selecting the window
+    with isel is lazy, so only the data inside the window is read from
+    disk afterwards. This is far cheaper than masking a global dataset
+    with a polygon.
+    """
+    xmin, ymin, xmax, ymax = bounds
+    window = {}
+    for dim, lower, upper in [(x_dim, xmin, xmax), (y_dim, ymin, ymax)]:
+        coords = ds[dim].values
+        half_res = np.abs(np.diff(coords)).min() / 2 if coords.size > 1 else 0
+        idx = np.nonzero((coords + half_res > lower) & (coords - half_res < upper))[0]
+        if idx.size == 0:
+            raise ValueError(f"Bounds {tuple(bounds)} do not intersect the dataset.")
+        window[dim] = slice(idx[0], idx[-1] + 1)
+
+    return window
+
+
+def get_lookup_table(value_map: dict, dtype: np.dtype) -> np.ndarray:
+    """
+    Creates a lookup table to reclassify an array of unsigned integers.
+
+    Parameters
+    ----------
+    value_map: dictionary with old_value:new_value pairs.
+    dtype:     data type of the arrays to reclassify. Must be an 8-bit
+               or 16-bit unsigned integer type.
+
+    Returns
+    -------
+    1D array where the position of each old value holds its new value.
+
+    Notes
+    -----
+    Values that are not specified in value_map are mapped to themselves.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind != "u" or dtype.itemsize > 2:
+        raise ValueError("dtype must be an 8-bit or 16-bit unsigned integer type")
+
+    lut = np.arange(np.iinfo(dtype).max + 1)
+    lut[list(value_map.keys())] = list(value_map.values())
+
+    return lut
+
+
+def get_month_wise_outliers(
+    arr: np.ndarray, months: np.ndarray, factor: float = 1.5
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Detects month-wise outliers in every series along the first axis of
+    an array at once. An observation is an outlier if it falls below
+    (above) the 25th (75th) percentile of the observations of the same
+    month minus (plus) factor times their interquartile range (IQR).
+
+    Parameters
+    ----------
+    arr:    array whose first axis is time (e.g. a (time, region) table
+            of monthly series or a (time, lat, lon) cube).
+    months: 1D array with the month (1-12) of each time step.
+    factor: number of IQRs away from the quartiles an observation must
+            be to be considered an outlier.
+
+    Returns
+    -------
+    Tuple with two boolean arrays of the same shape as arr marking the
+    outliers below and above the thresholds.
+
+    Notes
+    -----
+    Quartiles are computed with linear interpolation, as scipy's iqr
+    and NumPy's percentile functions do by default. The observations of
+    each month of all the series are sorted once and both quartiles are
+    interpolated from them. Missing values (NaN) are ignored (as in
+    NumPy's nanpercentile) and are never outliers. Series without any
+    observation of a month have no outliers in that month.
+    """
+    arr = np.asarray(arr, dtype=float)
+    months = np.asarray(months)
+
+    below = np.zeros(arr.shape, dtype=bool)
+    above = np.zeros(arr.shape, dtype=bool)
+    for month in np.unique(months):
+        idx = months == month
+
+        # NaN values are sorted last, so the quartiles of each series are
+        # interpolated from its first n (i.e. non-missing) observations.
+        obs = np.sort(arr[idx], axis=0)
+        n = np.count_nonzero(~np.isnan(obs), axis=0)
+        q1, q3 = (_sorted_quantile(obs, n, q) for q in (0.25, 0.75))
+        iqr = q3 - q1
+        below[idx] = arr[idx] < q1 - (factor * iqr)
+        above[idx] = arr[idx] > q3 + (factor * iqr)
+
+    return below, above
+
+
+def get_pixel_areas(transform, rows: int, ellps: str = "WGS84") -> np.ndarray:
+    """
+    Computes the geodesic area of the pixels of each row of a raster in
+    geographic coordinates.
+
+    Parameters
+    ----------
+    transform: raster's affine transform (e.g. rasterio's transform).
+    rows:      raster's number of rows.
+    ellps:     name of the ellipsoid used to compute the areas.
+
+    Returns
+    -------
+    1D array with the area (in square meters) of a pixel of each row.
+
+    Notes
+    -----
+    In a regular latitude/longitude grid the area of a pixel only depends
+    on its latitude, so every pixel in a row has the same area.
+    """
+    geod = pyproj.Geod(ellps=ellps)
+    lats = transform.f + transform.e * np.arange(rows + 1)
+    lons = [0, transform.a, transform.a, 0]
+
+    areas = np.empty(rows)
+    for i in range(rows):
+        pixel_lats = [lats[i], lats[i], lats[i + 1], lats[i + 1]]
+        areas[i] = abs(geod.polygon_area_perimeter(lons, pixel_lats)[0])
+
+    return areas
+
+
+def mann_kendall(
+    arr: np.ndarray, alpha: float = 0.05
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Runs the Mann-Kendall trend test on every series along the first
+    axis of an array at once.
+
+    Parameters
+    ----------
+    arr:   array whose first axis is time (e.g. a (year, lat, lon) cube).
+           Series must not have missing values.
+    alpha: significance level of the test.
+
+    Returns
+    -------
+    Tuple with arrays of the shape of arr without its first axis:
+        * h:     whether there is a significant trend.
+        * p:     p-value of the (two-tailed) test.
+        * z:     normalized test statistic.
+        * tau:   Kendall's tau.
+        * s:     Mann-Kendall's score.
+        * var_s: variance of s.
+
+    Notes
+    -----
+    Gives the same results as pymannkendall's original_test, including
+    the variance correction for tied values: a group of t tied values
+    subtracts t(t - 1)(2t + 5) from the variance, which is the same as
+    subtracting (t_i - 1)(2t_i + 5) for every value i, where t_i is the
+    number of values equal to it. Both s and the number of ties of each
+    value are computed with one vectorized operation per pair of time
+    steps.
+    """
+    arr = np.asarray(arr, dtype=float)
+    n = arr.shape[0]
+
+    s = np.zeros(arr.shape[1:])
+    ties = np.zeros(arr.shape, dtype=np.int64)
+    for i in range(n - 1):
+        diff = arr[i + 1:] - arr[i]
+        s += np.sign(diff).sum(axis=0)
+        equal = diff == 0
+        ties[i] += equal.sum(axis=0)
+        ties[i + 1:] += equal
+    ties += 1
+
+    var_s = (
+        n * (n - 1) * (2 * n + 5) - np.sum((ties - 1) * (2 * ties + 5), axis=0)
+    ) / 18
+
+    z = np.zeros(s.shape)
+    pos = s > 0
+    neg = s < 0
+    z[pos] = (s[pos] - 1) / np.sqrt(var_s[pos])
+    z[neg] = (s[neg] + 1) / np.sqrt(var_s[neg])
+
+    p = 2 * (1 - norm.cdf(np.abs(z)))
+    h = np.abs(z) > norm.ppf(1 - alpha / 2)
+    tau = s / (0.5 * n * (n - 1))
+
+    return h, p, z, tau, s, var_s
+
+
 def reclassify(arr: np.ndarray, value_map: dict) -> np.ndarray:
     """
     Reclassifies an array by mapping one or more values to a specific new value.
@@ -189,10 +938,16 @@ def reclassify(arr: np.ndarray, value_map: dict) -> np.ndarray:
     Notes
     -----
     Old values that are not specified in value_map remain the same in the new
-    array. In order to avoid overwriting reclassified values, a boolean mask is
-    created from the original array for each set of old values rather than from
-    the new array. Thus, a copy of the original array is necessary.
+    array. 8-bit and 16-bit unsigned integer arrays are reclassified with a
+    single lookup table indexing operation. For other types, in order to avoid
+    overwriting reclassified values, a boolean mask is created from the original
+    array for each set of old values rather than from the new array. Thus, a
+    copy of the original array is necessary.
     """
+    if arr.dtype.kind == "u" and arr.dtype.itemsize <= 2:
+        lut = get_lookup_table(value_map, arr.dtype)
+        return lut.astype(arr.dtype)[arr]
+
     new_arr = arr.copy()
     for old_value, new_value in value_map.items():
         mask = arr == old_value
@@ -201,6 +956,206 @@ def reclassify(arr: np.ndarray, value_map: dict) -> np.ndarray:
     return new_arr
 
 
+def reclassify_raster(
+    src_ds: gdal.Dataset,
+    fn: str,
+    value_map: dict,
+    gdtype: int = gdal.GDT_Byte,
+    driver: str = "GTiff",
+    nd_val: float = None,
+    options: list = [],
+    min_block_rows: int = 256
+) -> gdal.Dataset:
+    """
+    Reclassifies the first band of a raster block by block using a
+    lookup table and writes the result to a new single band raster.
+
+    Parameters
+    ----------
+    src_ds:         GDAL dataset to reclassify.
+    fn:             output raster's file name.
+    value_map:      dictionary with old_value:new_value pairs.
+    gdtype:         output raster's GDAL data type.
+    driver:         output raster's driver name.
+    nd_val:         output raster's NoData value.
+    options:        GDAL creation options.
+    min_block_rows: minimum number of rows to read at a time. Avoids
+                    reading one row at a time from rasters stored in
+                    strips.
+
+    Returns
+    -------
+    Reclassified GDAL dataset.
+
+    Notes
+    -----
+    Only one block of the source and output rasters is held in memory at
+    a time. Bands with types other than 8-bit and 16-bit unsigned
+    integers are reclassified block by block with reclassify.
+    """
+    src_band = src_ds.GetRasterBand(1)
+    src_dtype = np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(src_band.DataType))
+    dst_dtype = gdal_array.GDALTypeCodeToNumericTypeCode(gdtype)
+    if src_dtype.kind == "u" and src_dtype.itemsize <= 2:
+        lut = get_lookup_table(value_map, src_dtype).astype(dst_dtype)
+    else:
+        lut = None
+
+    driver = gdal.GetDriverByName(driver)
+    if not driver:
+        raise Exception(
+            "Driver name is not valid. Check "
+            "https://gdal.org/drivers/raster/index.html for valid names."
+        )
+    cols = src_ds.RasterXSize
+    rows = src_ds.RasterYSize
+    out_ds = driver.Create(fn, cols, rows, 1, gdtype, options)
+    out_ds.SetProjection(src_ds.GetProjection())
+    out_ds.SetGeoTransform(src_ds.GetGeoTransform())
+    out_band = out_ds.GetRasterBand(1)
+    if nd_val is not None:
+        out_band.SetNoDataValue(nd_val)
+
+    block_xsize, block_ysize = src_band.GetBlockSize()
+    if block_xsize == cols:
+        block_ysize = max(block_ysize, min_block_rows)
+
+    for xoff, yoff, xsize, ysize in get_block_windows(
+        cols, rows, block_xsize, block_ysize
+    ):
+        block = src_band.ReadAsArray(xoff, yoff, xsize, ysize)
+        if lut is not None:
+            block = lut[block]
+        else:
+            block = reclassify(block, value_map).astype(dst_dtype)
+        out_band.WriteArray(block, xoff, yoff)
+
+    out_band.FlushCache()
+
+    return out_ds
+
+
+def remove_small_patches(
+    mask: np.ndarray, pixel_areas: np.ndarray, threshold: float
+) -> np.ndarray:
+    """
+    Removes the patches (i.e. 4-connected groups of pixels) of a mask
+    whose area is below a threshold.
+
+    Parameters
+    ----------
+    mask:        2D boolean array.
+    pixel_areas: 1D array with the area of a pixel of each row (see
+                 get_pixel_areas).
+    threshold:   minimum area of the patches to keep.
+
+    Returns
+    -------
+    2D boolean array with only the patches whose area is equal to or
+    above the threshold.
+
+    Notes
+    -----
+    The connectivity is the same used by rasterio.features.shapes, so
+    each of the remaining patches is vectorized to a single polygon.
+    """
+    labels, n = ndimage.label(mask)
+
+    # Area of each patch is the sum of the areas of its pixels.
+    idx = np.flatnonzero(labels)
+    rows = idx // mask.shape[1]
+    areas = np.bincount(
+        labels.ravel()[idx], weights=pixel_areas[rows], minlength=n + 1
+    )
+
+    keep = areas >= threshold
+    keep[0] = False
+
+    return keep[labels]
+
+
+def sens_slope(arr: np.ndarray) -> np.ndarray:
+    """
+    Computes the Theil-Sen's slope of every series along the first axis
+    of an array at once.
+
+    Parameters
+    ----------
+    arr: array whose first axis is time (e.g. a (year, lat, lon) cube).
+         Series must not have missing values.
+
+    Returns
+    -------
+    Array of the shape of arr without its first axis with the median of
+    the slopes between every pair of time steps.
+
+    Notes
+    -----
+    The slopes of all n(n - 1) / 2 pairs are held in memory at once, so
+    large arrays should be processed in spatial tiles.
+    """
+    arr = np.asarray(arr, dtype=float)
+    n = arr.shape[0]
+
+    slopes = np.empty((n * (n - 1) // 2,) + arr.shape[1:])
+    idx = 0
+    for i in range(n - 1):
+        j = np.arange(i + 1, n).reshape((-1,) + (1,) * (arr.ndim - 1))
+        slopes[idx:idx + n - i - 1] = (arr[i + 1:] - arr[i]) / (j - i)
+        idx += n - i - 1
+
+    return np.median(slopes, axis=0)
+
+
+def set_cube_encoding(
+    ds: xr.Dataset,
+    time_chunk: int = 12,
+    spatial_chunk: int = 256,
+    complevel: int = 4,
+    x_dim: str = "x",
+    y_dim: str = "y"
+) -> xr.Dataset:
+    """
+    Sets the chunking and compression used to write the variables of a
+    data cube to a NetCDF4 file.
+
+    Parameters
+    ----------
+    ds:            Dataset with a time and two spatial dimensions.
+    time_chunk:    number of time steps in each chunk.
+    spatial_chunk: number of rows and columns in each chunk.
+    complevel:     zlib compression level (1-9).
+    x_dim:         name of the x (longitude) dimension.
+    y_dim:         name of the y (latitude) dimension.
+
+    Returns
+    -------
+    Dataset with the encoding of its variables updated.
+
+    Notes
+    -----
+    Chunks span a year of monthly data over a tile of pixels. A single
+    month's map is then read from a row of tiles and the full series of
+    a pixel from a column of chunks, instead of having to traverse the
+    whole file as with a contiguous (row-major) layout. Byte shuffling
+    greatly improves the compression of integer data such as burn dates.
+    """
+    sizes = {"time": time_chunk, x_dim: spatial_chunk, y_dim: spatial_chunk}
+    for name, da in ds.data_vars.items():
+        if da.ndim == 0:
+            continue
+        chunksizes = tuple(
+            min(size, sizes.get(dim, size)) for dim, size in zip(da.dims, da.shape)
+        )
+        for key in ("contiguous", "chunksizes", "preferred_chunks", "original_shape"):
+            da.encoding.pop(key, None)
+        da.encoding.update(
+            zlib=True, complevel=complevel, shuffle=True, chunksizes=chunksizes
+        )
+
+    return ds
+
+
 def unzip_file(src: str, dst: str) -> None:
     """
     Unzips zip files.
@@ -221,3 +1176,165 @@ def unzip_file(src: str, dst: str) -> None:
             zip_ref.extractall(dst)
     else:
         raise NotImplementedError
+
+
+def write_cubes(
+    datasets: List[xr.Dataset],
+    paths: List[str],
+    fmt: str = "netcdf",
+    x_dim: str = "x",
+    y_dim: str = "y",
+    **kwargs
+) -> None:
+    """
+    Writes several data cubes with chunking and compression, computing
+    all of them at once.
+
+    Parameters
+    ----------
+    datasets: list of datasets with a time and two spatial dimensions.
+    paths:    output paths (one for each dataset).
+    fmt:      output format. Either 'netcdf' or 'zarr'.
+    x_dim:    name of the x (longitude) dimension.
+    y_dim:    name of the y (latitude) dimension.
+    kwargs:   extra keyword arguments passed to set_cube_encoding (e.g.
+              time_chunk or spatial_chunk).
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    If the datasets are backed by dask and derive from the same source
+    (e.g. the output of clip_regions), computing them at once guarantees
+    each chunk of the source is only read once. Zarr stores use the
+    same chunk shape as the NetCDF4 files and Zarr's default compressor.
+    """
+    datasets = [
+        set_cube_encoding(ds, x_dim=x_dim, y_dim=y_dim, **kwargs) for ds in datasets
+    ]
+
+    if fmt == "netcdf":
+        xr.save_mfdataset(datasets, paths)
+
+    elif fmt == "zarr":
+        writes = []
+        for ds, path in zip(datasets, paths):
+            chunks = {}
+            for name, da in ds.data_vars.items():
+                chunksizes = da.encoding.get("chunksizes", ())
+                chunks.update(zip(da.dims, chunksizes))
+                # Keep only the encoding that is valid for Zarr stores.
+                da.encoding = {
+                    key: value for key, value in da.encoding.items()
+                    if key in ("dtype", "_FillValue", "scale_factor", "add_offset")
+                }
+            ds = ds.chunk(chunks)
+            writes.append(ds.to_zarr(path, mode="w", compute=False))
+        dask.compute(*writes)
+
+    else:
+        raise ValueError("fmt must be either 'netcdf' or 'zarr'")
+
+
+def _clip_to_mask(
+    ds: xr.Dataset,
+    mask: gpd.GeoDataFrame,
+    x_dim: str,
+    y_dim: str,
+    all_touched: bool
+) -> xr.Dataset:
+    """
+    Crops a dataset to the extent of a set of polygons and sets the
+    pixels outside them to the variables' NoData value.
+    """
+    region_mask = geometry_mask(
+        mask.geometry,
+        out_shape=(ds[y_dim].size, ds[x_dim].size),
+        transform=ds.rio.transform(recalc=True),
+        invert=True,
+        all_touched=all_touched
+    )
+
+    # Crop to the extent of the rasterized polygons.
+    rows = np.nonzero(region_mask.any(axis=1))[0]
+    cols = np.nonzero(region_mask.any(axis=0))[0]
+    rows = slice(rows[0], rows[-1] + 1)
+    cols = slice(cols[0], cols[-1] + 1)
+    ds = ds.isel({y_dim: rows, x_dim: cols})
+    region_mask = xr.DataArray(region_mask[rows, cols], dims=(y_dim, x_dim))
+
+    for name, da in ds.data_vars.items():
+        if x_dim not in da.dims or y_dim not in da.dims:
+            continue
+        nodata = da.rio.encoded_nodata
+        if nodata is None:
+            nodata = da.rio.nodata
+        if nodata is None:
+            nodata = np.nan
+        clipped = da.where(region_mask, nodata)
+        clipped.attrs = da.attrs
+        clipped.encoding = da.encoding
+        ds[name] = clipped
+
+    return ds
+
+
+def _get_content_size(r: requests.Response) -> Union[int, None]:
+    """
+    Gets the size in bytes of the whole file from the headers of a
+    response to a range request or of a full response, if available.
+    """
+    if r.status_code == 206:
+        total = r.headers.get("Content-Range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+    if "Content-Length" in r.headers and "Content-Encoding" not in r.headers:
+        return int(r.headers["Content-Length"])
+
+    return None
+
+
+def _is_complete(fn: str, size: int, checksum: str, hash_name: str) -> bool:
+    """
+    Checks whether a file exists and has the expected size and checksum.
+    """
+    if not os.path.exists(fn):
+        return False
+    if size is not None and os.path.getsize(fn) != size:
+        return False
+    if checksum is not None:
+        h = hashlib.new(hash_name)
+        with open(fn, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                h.update(chunk)
+        return h.hexdigest() == checksum.lower()
+
+    return True
+
+
+def _sorted_quantile(obs: np.ndarray, n: np.ndarray, q: float) -> np.ndarray:
+    """
+    Computes a quantile of the first n observations of each series along
+    the first axis of a sorted array with linear interpolation. Series
+    without observations get NaN.
+    """
+    pos = np.maximum(n - 1, 0) * q
+    lower = np.floor(pos).astype(np.intp)
+    upper = np.ceil(pos).astype(np.intp)
+    lower_values = np.take_along_axis(obs, lower[np.newaxis], axis=0)[0]
+    upper_values = np.take_along_axis(obs, upper[np.newaxis], axis=0)[0]
+    quantile = lower_values + (pos - lower) * (upper_values - lower_values)
+
+    return np.where(n > 0, quantile, np.nan)
+
+
+def _write_response(
+    r: requests.Response, fn: str, mode: str, chunk_size: int
+) -> None:
+    """
+    Writes the content of a streamed response to a file.
+    """
+    with open(fn, mode) as file:
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            file.write(chunk)
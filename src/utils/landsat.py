@@ -0,0 +1,377 @@
+# -----------------------------------------------------------------------
+# Author: Marcelo Villa-Piñeros
+#
+# Purpose: Contains functions to build, cache and query a local index of
+# the Landsat 8 scenes available in the AWS Public Dataset Program and
+# to download the bands of the selected scenes.
+#
+# Notes: The full scene list is a gzip compressed CSV file of several
+# hundred MB. It is read in chunks keeping only the needed columns and
+# the scenes that could ever be selected (i.e. tier 1 scenes in the
+# path/rows of interest), so the local index is small enough to be
+# loaded and queried in milliseconds.
+#
+# The index page of each scene is parsed only once; the links to its
+# TIF files are cached in a JSON file.
+# -----------------------------------------------------------------------
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+from bs4 import BeautifulSoup
+
+from src.utils.functions import download_http_file, get_http_session
+
+SCENE_LIST_COLUMNS = [
+    "productId",
+    "entityId",
+    "acquisitionDate",
+    "cloudCover",
+    "processingLevel",
+    "path",
+    "row",
+    "download_url",
+]
+
+SCENE_LIST_DTYPES = {
+    "productId": str,
+    "entityId": str,
+    "cloudCover": np.float32,
+    "processingLevel": "category",
+    "path": np.uint16,
+    "row": np.uint16,
+    "download_url": str,
+}
+
+
+def build_scene_index(
+    src: str, prs: Iterable[int] = None, chunksize: int = 100000
+) -> pd.DataFrame:
+    """
+    Builds an index of the Landsat 8 tier 1 scenes from the scene list.
+
+    Parameters
+    ----------
+    src:       path or URL of the gzip compressed scene list.
+    prs:       path/row numbers (e.g. 4056 for path 4 and row 56) of the
+               scenes to keep. If None, all the path/rows are kept.
+    chunksize: number of lines of the scene list to read at a time.
+
+    Returns
+    -------
+    DataFrame with the scenes sorted by path/row and acquisition date.
+    """
+    if prs is not None:
+        prs = np.unique(np.asarray(list(prs), dtype=np.uint32))
+
+    reader = pd.read_csv(
+        src,
+        compression="gzip",
+        usecols=SCENE_LIST_COLUMNS,
+        dtype=SCENE_LIST_DTYPES,
+        parse_dates=["acquisitionDate"],
+        chunksize=chunksize,
+    )
+
+    chunks = []
+    for chunk in reader:
+
+        chunk["pr"] = chunk["path"].astype(np.uint32) * 1000 + chunk["row"]
+
+        # Remove real-time (RT) and tier 2 (T2) scenes which have to go
+        # through further preprocessing and calibration.
+        tier = chunk["productId"].str[-2:]
+        mask = (tier != "RT") & (tier != "T2")
+        if prs is not None:
+            mask &= chunk["pr"].isin(prs)
+
+        chunks.append(chunk.loc[mask])
+
+    index = pd.concat(chunks, ignore_index=True)
+    index = index.sort_values(["pr", "acquisitionDate"], ignore_index=True)
+    index.attrs["prs"] = None if prs is None else prs.tolist()
+
+    return index
+
+
+def get_scene_index(
+    src: str, fn: str, prs: Iterable[int] = None, overwrite: bool = False
+) -> pd.DataFrame:
+    """
+    Gets the index of the Landsat 8 tier 1 scenes, loading it from a
+    local file if it exists, covers the requested path/rows and was
+    built from the current version of the scene list, or building and
+    saving it otherwise.
+
+    Parameters
+    ----------
+    src:       path or URL of the gzip compressed scene list.
+    fn:        path to the local index file.
+    prs:       path/row numbers of the scenes to keep. If None, all the
+               path/rows are kept.
+    overwrite: whether to rebuild the index even if a valid local index
+               exists.
+
+    Returns
+    -------
+    DataFrame with the scenes sorted by path/row and acquisition date.
+
+    Notes
+    -----
+    The version of the scene list (see get_source_version) is saved with
+    the index. If the version cannot be determined (e.g. when offline),
+    a local index that covers the requested path/rows is used.
+    """
+    version = get_source_version(src)
+
+    if os.path.exists(fn) and not overwrite:
+        index = pd.read_pickle(fn)
+        cached_prs = index.attrs.get("prs")
+        is_current = version is None or index.attrs.get("version") == version
+        if is_current and (
+            cached_prs is None
+            or (prs is not None and set(map(int, prs)).issubset(cached_prs))
+        ):
+            return index
+
+    index = build_scene_index(src, prs)
+    index.attrs["version"] = version
+
+    folder = os.path.dirname(fn)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    index.to_pickle(fn)
+
+    return index
+
+
+def get_source_version(src: str, session: requests.Session = None) -> str:
+    """
+    Gets a string that changes whenever the scene list is updated.
+
+    Parameters
+    ----------
+    src:     path or URL of the scene list.
+    session: requests session to request the URL's headers with. If
+             nothing is passed, the session returned by get_http_session
+             is used.
+
+    Returns
+    -------
+    ETag or Last-Modified header of the URL, or modification time of
+    the local file. None if none of them are available.
+    """
+    if not src.startswith(("http://", "https://")):
+        return str(os.path.getmtime(src)) if os.path.exists(src) else None
+
+    session = session or get_http_session()
+    try:
+        r = session.head(src, allow_redirects=True)
+        r.raise_for_status()
+    except requests.exceptions.RequestException:
+        return None
+
+    return r.headers.get("ETag") or r.headers.get("Last-Modified")
+
+
+def select_scenes(
+    index: pd.DataFrame,
+    start_date: str,
+    end_date: str,
+    cloud_threshold: float,
+    prs: Iterable[int] = None
+) -> pd.DataFrame:
+    """
+    Selects scenes from the index by acquisition date, cloud cover and
+    path/row.
+
+    Parameters
+    ----------
+    index:           DataFrame returned by get_scene_index.
+    start_date:      first acquisition date (inclusive).
+    end_date:        last acquisition date (inclusive).
+    cloud_threshold: maximum cloud cover (inclusive).
+    prs:             path/row numbers to keep. If None, all the
+                     path/rows in the index are kept.
+
+    Returns
+    -------
+    DataFrame with the selected scenes.
+    """
+    dates = index["acquisitionDate"]
+    mask = (
+        (dates >= pd.Timestamp(start_date))
+        & (dates <= pd.Timestamp(end_date))
+        & (index["cloudCover"] <= cloud_threshold)
+    )
+    if prs is not None:
+        mask &= index["pr"].isin(np.asarray(list(prs), dtype=np.uint32))
+
+    return index.loc[mask]
+
+
+def filter_band_urls(urls: Iterable[str], bands: Iterable[str]) -> List[str]:
+    """
+    Keeps the URLs of the TIF files of specific bands.
+
+    Parameters
+    ----------
+    urls:  URLs of the TIF files of a scene.
+    bands: names of the bands to keep (e.g. 'B1').
+
+    Returns
+    -------
+    List with the URLs of the wanted bands.
+    """
+    # Bands are matched with a dot (.) at the end to avoid confusions
+    # between bands B1 and B10 and B11.
+    return [url for url in urls if any(f"_{band}." in url for band in bands)]
+
+
+def get_tif_urls(index_url: str, session: requests.Session = None) -> List[str]:
+    """
+    Gets the URLs of all the TIF files linked from a scene's index page.
+
+    Parameters
+    ----------
+    index_url: URL of the scene's index.html page.
+    session:   requests session to fetch the page with. If nothing is
+               passed, the session returned by get_http_session is used.
+
+    Returns
+    -------
+    List with the URLs of the TIF files.
+    """
+    session = session or get_http_session()
+    r = session.get(index_url)
+    r.raise_for_status()
+    soup = BeautifulSoup(r.content, features="html.parser")
+
+    # Isolate base url to join later with filename.
+    base_url = os.path.dirname(index_url)
+
+    # Select all anchor tags whose href attribute is a TIF file.
+    tags = soup.find_all("a", href=True)
+    return [
+        f"{base_url}/{tag['href']}" for tag in tags if tag["href"].endswith(".TIF")
+    ]
+
+
+def download_scenes(
+    scenes: List[Tuple[str, str]],
+    bands: Iterable[str],
+    max_files: int = 8,
+    max_pages: int = 8,
+    cache_fn: str = None,
+    session: requests.Session = None
+) -> Iterator[Tuple[str, Exception]]:
+    """
+    Resolves the index pages of several scenes concurrently and downloads
+    the wanted bands of each scene as soon as its page is resolved.
+
+    Parameters
+    ----------
+    scenes:    list of (index_url, save_to) pairs where save_to is the
+               folder to save the bands of the scene to.
+    bands:     names of the bands to download (e.g. 'B1').
+    max_files: maximum number of files downloaded at the same time
+               across all scenes.
+    max_pages: maximum number of index pages fetched at the same time.
+    cache_fn:  path to a JSON file used to cache the TIF URLs of each
+               index page. If nothing is passed, nothing is cached.
+    session:   requests session shared by all the requests. If nothing
+               is passed, the session returned by get_http_session is
+               used.
+
+    Returns
+    -------
+    Generator of (index_url, error) pairs in the order in which scenes
+    finish. error is None if all the bands of the scene were downloaded
+    and the raised exception otherwise.
+
+    Notes
+    -----
+    Bands that have already been completely downloaded are skipped (see
+    download_http_file).
+    """
+    session = session or get_http_session(pool_size=max_files + max_pages)
+    cache = _load_url_cache(cache_fn)
+    lock = threading.Lock()
+
+    def resolve(index_url: str) -> List[str]:
+        with lock:
+            urls = cache.get(index_url)
+        if urls is None:
+            urls = get_tif_urls(index_url, session)
+            with lock:
+                cache[index_url] = urls
+        return filter_band_urls(urls, bands)
+
+    with ThreadPoolExecutor(max_workers=max_pages) as resolvers, \
+            ThreadPoolExecutor(max_workers=max_files) as downloaders:
+
+        try:
+            # Bands are queued for download as soon as the index page of
+            # their scene is resolved.
+            resolving = {
+                resolvers.submit(resolve, index_url): (index_url, save_to)
+                for index_url, save_to in scenes
+            }
+            downloading = {}
+            remaining = {}
+            for future in as_completed(resolving):
+                index_url, save_to = resolving[future]
+                if future.exception() is not None:
+                    yield index_url, future.exception()
+                    continue
+                urls = future.result()
+                if not urls:
+                    yield index_url, None
+                    continue
+                if not os.path.exists(save_to):
+                    os.makedirs(save_to, exist_ok=True)
+                remaining[index_url] = len(urls)
+                for url in urls:
+                    downloading[
+                        downloaders.submit(download_http_file, url, save_to, session)
+                    ] = index_url
+
+            errors = {}
+            for future in as_completed(downloading):
+                index_url = downloading[future]
+                remaining[index_url] -= 1
+                if future.exception() is not None:
+                    errors.setdefault(index_url, future.exception())
+                if remaining[index_url] == 0:
+                    yield index_url, errors.get(index_url)
+
+        finally:
+            _save_url_cache(cache_fn, cache)
+
+
+def _load_url_cache(fn: str) -> Dict[str, List[str]]:
+    """
+    Loads the cached TIF URLs of the index pages.
+    """
+    if fn is None or not os.path.exists(fn):
+        return {}
+    with open(fn) as file:
+        return json.load(file)
+
+
+def _save_url_cache(fn: str, cache: Dict[str, List[str]]) -> None:
+    """
+    Saves the cached TIF URLs of the index pages.
+    """
+    if fn is None:
+        return
+    folder = os.path.dirname(fn)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(fn, "w") as file:
+        json.dump(cache, file, indent=2, sort_keys=True)
@@ -0,0 +1,119 @@
+# -----------------------------------------------------------------------
+# Author: Marcelo Villa-Piñeros
+#
+# Purpose: Contains a task runner that processes independent tasks (e.g.
+# Landsat 8 scenes) in a process pool, writing the result of each task
+# to its own partial output file.
+#
+# Notes: A partial file only exists once its task has finished: results
+# are first written to a temporary file that is renamed when the task
+# succeeds. Thus, if the execution is interrupted, running it again
+# only processes the tasks that did not finish.
+# -----------------------------------------------------------------------
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Tuple
+
+
+def get_partial_filename(folder: str, key: str, ext: str) -> str:
+    """
+    Builds the path of the partial output file of a task.
+
+    Parameters
+    ----------
+    folder: folder with the partial output files.
+    key:    task's unique identifier (e.g. a Landsat 8 product ID).
+    ext:    file extension (e.g. '.csv').
+
+    Returns
+    -------
+    Path to the partial output file.
+    """
+    return os.path.join(folder, f"{key}{ext}")
+
+
+def get_partial_filenames(folder: str, keys: List[str], ext: str) -> List[str]:
+    """
+    Gets the paths of the existing partial output files of several tasks.
+
+    Parameters
+    ----------
+    folder: folder with the partial output files.
+    keys:   tasks' unique identifiers.
+    ext:    file extension (e.g. '.csv').
+
+    Returns
+    -------
+    List with the paths of the partial output files that exist, in the
+    same order as keys.
+    """
+    filenames = [get_partial_filename(folder, key, ext) for key in keys]
+    return [fn for fn in filenames if os.path.exists(fn)]
+
+
+def run_tasks(
+    func: Callable,
+    tasks: Dict[str, tuple],
+    folder: str,
+    ext: str,
+    max_workers: int = None,
+    overwrite: bool = False
+) -> Iterator[Tuple[str, Exception]]:
+    """
+    Runs several tasks in a process pool, skipping the tasks whose
+    partial output file already exists.
+
+    Parameters
+    ----------
+    func:        function that runs a task. It is called as
+                 func(*args, save_to) and must write its result to the
+                 save_to path. It must be defined at the top level of a
+                 module to be sent to the worker processes.
+    tasks:       dictionary with key:args pairs where key is the task's
+                 unique identifier and args is a tuple with the
+                 arguments passed to func.
+    folder:      folder with the partial output files.
+    ext:         extension of the partial output files (e.g. '.csv').
+    max_workers: maximum number of tasks run at the same time. If None,
+                 the number of processors is used.
+    overwrite:   whether to run all the tasks even if their partial
+                 output file already exists.
+
+    Returns
+    -------
+    Generator of (key, error) pairs in the order in which the tasks that
+    were run finish. error is None if the task succeeded and the raised
+    exception otherwise.
+    """
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    pending = {
+        key: args
+        for key, args in tasks.items()
+        if overwrite or not os.path.exists(get_partial_filename(folder, key, ext))
+    }
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                _run_task, func, args, get_partial_filename(folder, key, ext)
+            ): key
+            for key, args in pending.items()
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.exception()
+
+
+def _run_task(func: Callable, args: tuple, save_to: str) -> None:
+    """
+    Runs a task writing its result to a temporary file that is renamed
+    to save_to once the task succeeds.
+    """
+    root, ext = os.path.splitext(save_to)
+    part_fn = f"{root}.part{ext}"
+    if os.path.exists(part_fn):
+        os.remove(part_fn)
+
+    func(*args, part_fn)
+    os.replace(part_fn, save_to)
@@ -0,0 +1,406 @@
+# -----------------------------------------------------------------------
+# Author: Marcelo Villa-Piñeros
+#
+# Purpose: Contains local HTTP servers that stand in for the remote
+# services used by the project. They make it possible to test and
+# benchmark the download functions offline.
+# -----------------------------------------------------------------------
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import partial
+from http import HTTPStatus
+from http.server import (
+    BaseHTTPRequestHandler,
+    SimpleHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from typing import List, Tuple
+
+
+class LocalHTTPServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server that ignores clients closing their connection
+    before a response is fully sent (e.g. when a download is resumed).
+
+    Handlers that support it track their requests (see track_request):
+    the number of requests received for each path is kept in the
+    requests attribute (a Counter) and the maximum number of requests
+    handled at the same time in the max_active attribute.
+    """
+
+    daemon_threads = True
+
+    # Large enough for many clients connecting at the same time, which
+    # would otherwise wait for their connection attempts to be retried.
+    request_queue_size = 128
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = Counter()
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.requests.clear()
+            self.max_active = self.active
+
+    @contextmanager
+    def track_request(self, path: str):
+        with self.lock:
+            self.requests[path] += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves the files of a directory supporting single byte range
+    requests (e.g. 'Range: bytes=100-').
+
+    If the drop_after class attribute is greater than zero, the
+    connection is closed after sending that number of bytes of any
+    response that starts at the beginning of a file and is longer than
+    that, to emulate an interrupted transfer.
+
+    If the unknown_size class attribute is True, range requests are
+    ignored and the Content-Length header is not sent, so the end of a
+    response is only signalled by closing the connection.
+    """
+
+    drop_after = 0
+    unknown_size = False
+
+    def do_GET(self):
+        with self.server.track_request(self.path):
+            super().do_GET()
+
+    def do_HEAD(self):
+        with self.server.track_request(self.path):
+            super().do_HEAD()
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        range_header = self.headers.get("Range")
+        if not range_header or self.unknown_size or not os.path.isfile(path):
+            return super().send_head()
+
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", range_header.strip())
+        size = os.path.getsize(path)
+        if not match or int(match.group(1)) >= size:
+            self.send_error(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            return None
+
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+        end = min(end, size - 1)
+
+        file = open(path, "rb")
+        file.seek(start)
+        self.send_response(HTTPStatus.PARTIAL_CONTENT)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self._start = start
+        self._remaining = end - start + 1
+
+        return file
+
+    def send_header(self, keyword, value):
+        if not (self.unknown_size and keyword == "Content-Length"):
+            super().send_header(keyword, value)
+
+    def end_headers(self):
+        if self.command in ("GET", "HEAD") and not self.unknown_size:
+            # Advertise range support on every file response.
+            self._headers_buffer.append(b"Accept-Ranges: bytes\r\n")
+        super().end_headers()
+
+    def copyfile(self, source, outputfile):
+        start = getattr(self, "_start", 0)
+        remaining = getattr(self, "_remaining", None)
+        self._start = 0
+        self._remaining = None
+        if self.drop_after > 0 and start == 0:
+            if remaining is None or remaining > self.drop_after:
+                outputfile.write(source.read(self.drop_after))
+                self.close_connection = True
+                return
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        while remaining > 0:
+            chunk = source.read(min(64 * 1024, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_directory(
+    path: str, port: int = 0, drop_after: int = 0, unknown_size: bool = False
+) -> Tuple[LocalHTTPServer, str]:
+    """
+    Serves the files of a directory in a background thread.
+
+    Parameters
+    ----------
+    path:       directory to serve.
+    port:       port to listen on. If 0, a free port is chosen.
+    drop_after:   if greater than zero, responses that start at the
+                  beginning of a file are interrupted after sending this
+                  number of bytes. See RangeRequestHandler.
+    unknown_size: whether to ignore range requests and not to send the
+                  size of the files. See RangeRequestHandler.
+
+    Returns
+    -------
+    Tuple with the server (call its shutdown method to stop it) and the
+    base URL of the served directory.
+    """
+    handler = type(
+        "RangeRequestHandler",
+        (RangeRequestHandler,),
+        {"drop_after": drop_after, "unknown_size": unknown_size},
+    )
+    return start_server(partial(handler, directory=path), port)
+
+
+def start_server(handler, port: int = 0) -> Tuple[LocalHTTPServer, str]:
+    """
+    Starts a threaded HTTP server in a background thread.
+
+    Parameters
+    ----------
+    handler: request handler class (or callable returning one).
+    port:    port to listen on. If 0, a free port is chosen.
+
+    Returns
+    -------
+    Tuple with the server (call its shutdown method to stop it) and its
+    base URL.
+    """
+    server = LocalHTTPServer(("127.0.0.1", port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class MockAppEEARSHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the subset of the AppEEARS API used by the project
+    (i.e. login, logout, status, bundle and file download endpoints).
+
+    The state of the server is kept in the following class attributes,
+    which are set by start_mock_appeears_server:
+
+    * tasks:        dictionary with task_id:{"polls": n, "files": files}
+                    pairs, where n is the number of status requests
+                    answered with 'processing' before the task is 'done'
+                    and files is a dictionary with filename:content
+                    pairs.
+    * fail_every:   if greater than zero, every n-th request is answered
+                    with a 503 status code to emulate a flaky service.
+    * delay:        seconds to wait before answering each request to
+                    emulate a slow service.
+    * requests:     number of requests received.
+    * failures:     number of requests answered with a 503 status code.
+    """
+
+    tasks = {}
+    fail_every = 0
+    delay = 0
+    requests = 0
+    failures = 0
+    token = "mock-token"
+    lock = threading.Lock()
+
+    def do_POST(self):
+        if self._fail():
+            return
+        if self.path == "/login":
+            self._send_json({"token": self.token})
+        elif self.path == "/logout":
+            self.send_response(HTTPStatus.NO_CONTENT)
+            self.end_headers()
+        else:
+            self.send_error(HTTPStatus.NOT_FOUND)
+
+    def do_GET(self):
+        if self._fail():
+            return
+        parts = self.path.strip("/").split("/")
+
+        if parts[0] == "status" and len(parts) == 2 and parts[1] in self.tasks:
+            if not self._is_authorized():
+                return
+            task = self.tasks[parts[1]]
+            with self.lock:
+                task["polls"] -= 1
+                status = "done" if task["polls"] < 0 else "processing"
+            self._send_json({"task_id": parts[1], "status": status})
+
+        elif parts[0] == "bundle" and len(parts) == 2 and parts[1] in self.tasks:
+            files = self.tasks[parts[1]]["files"]
+            self._send_json(
+                {
+                    "task_id": parts[1],
+                    "files": [
+                        {
+                            "file_id": str(i),
+                            "file_name": name,
+                            "file_size": len(content),
+                            "file_type": os.path.splitext(name)[1][1:],
+                            "sha256": hashlib.sha256(content).hexdigest(),
+                        }
+                        for i, (name, content) in enumerate(files.items())
+                    ],
+                }
+            )
+
+        elif parts[0] == "bundle" and len(parts) == 3 and parts[1] in self.tasks:
+            files = list(self.tasks[parts[1]]["files"].items())
+            if not parts[2].isdigit() or int(parts[2]) >= len(files):
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+            name, content = files[int(parts[2])]
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Disposition", f"attachment; filename={name}")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        else:
+            self.send_error(HTTPStatus.NOT_FOUND)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _fail(self) -> bool:
+        if self.delay > 0:
+            time.sleep(self.delay)
+        with self.lock:
+            type(self).requests += 1
+            fail = self.fail_every > 0 and self.requests % self.fail_every == 0
+            if fail:
+                type(self).failures += 1
+        if fail:
+            self.send_error(HTTPStatus.SERVICE_UNAVAILABLE)
+        return fail
+
+    def _is_authorized(self) -> bool:
+        if self.headers.get("Authorization") != f"Bearer {self.token}":
+            self.send_error(HTTPStatus.UNAUTHORIZED)
+            return False
+        return True
+
+    def _send_json(self, obj) -> None:
+        body = json.dumps(obj).encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_mock_appeears_server(
+    tasks: dict, fail_every: int = 0, delay: float = 0, port: int = 0
+) -> Tuple[LocalHTTPServer, str]:
+    """
+    Starts a mock AppEEARS API in a background thread.
+
+    Parameters
+    ----------
+    tasks:      dictionary with task_id:{"polls": n, "files": files}
+                pairs. See MockAppEEARSHandler.
+    fail_every: if greater than zero, every n-th request is answered
+                with a 503 status code.
+    delay:      seconds to wait before answering each request.
+    port:       port to listen on. If 0, a free port is chosen.
+
+    Returns
+    -------
+    Tuple with the server (call its shutdown method to stop it) and the
+    API URL to pass to AppEEARSClient. The number of requests received
+    and of requests answered with a 503 status code are kept in the
+    requests and failures attributes of the server's
+    RequestHandlerClass.
+    """
+    handler = type(
+        "MockAppEEARSHandler",
+        (MockAppEEARSHandler,),
+        {
+            "tasks": tasks,
+            "fail_every": fail_every,
+            "delay": delay,
+            "requests": 0,
+            "failures": 0,
+        },
+    )
+    return start_server(handler, port)
+
+
+def write_mock_landsat_scenes(
+    path: str, product_ids: List[str], size: int = 1024
+) -> List[str]:
+    """
+    Writes a directory tree that mimics the Landsat 8 collection of the
+    AWS Public Dataset Program, to be served with serve_directory.
+
+    Each scene folder (c1/L8/{path}/{row}/{productId}) contains an
+    index.html page linking to random band files (B1-B11 and BQA) of
+    the given size and to a metadata text file.
+
+    Parameters
+    ----------
+    path:        root directory of the tree.
+    product_ids: Landsat 8 product IDs of the scenes.
+    size:        size in bytes of each band file.
+
+    Returns
+    -------
+    List with the paths of the index pages relative to the root
+    directory (one for each product ID).
+    """
+    bands = [f"B{i}" for i in range(1, 12)] + ["BQA"]
+    index_paths = []
+    for product_id in product_ids:
+        pr = product_id.split("_")[2]
+        folder = os.path.join("c1", "L8", pr[:3], pr[3:], product_id)
+        os.makedirs(os.path.join(path, folder), exist_ok=True)
+
+        filenames = [f"{product_id}_{band}.TIF" for band in bands]
+        filenames.append(f"{product_id}_MTL.txt")
+        for filename in filenames:
+            with open(os.path.join(path, folder, filename), "wb") as file:
+                file.write(os.urandom(size))
+
+        links = "\n".join(f'<li><a href="{fn}">{fn}</a></li>' for fn in filenames)
+        with open(os.path.join(path, folder, "index.html"), "w") as file:
+            file.write(f"<html><body><ul>\n{links}\n</ul></body></html>\n")
+
+        index_paths.append(f"{folder}/index.html".replace(os.sep, "/"))
+
+    return index_paths